@@ -8,11 +8,15 @@ Simplified architecture with direct Flask routes and consolidated modules:
 - services/: Business logic (portfolio, price, projection)
 """
 
+import functools
+import math
 import os
 import logging
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+import numpy as np
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -20,10 +24,11 @@ load_dotenv()
 
 from flask import Flask, render_template, request, jsonify, g
 from flask_cors import CORS
+import stripe
 
 # New consolidated imports
-from database import firebase_service, require_auth, get_current_user_id, get_current_user, require_premium, get_user_plan_info
-from payments import stripe_service
+from database import firebase_service, require_auth, get_current_user_id, get_current_user, require_premium_auth, get_user_plan_info
+from payments import get_stripe_service, _from_timestamp, _period_fields
 
 # Service imports
 from services.price_service import PriceService
@@ -40,9 +45,17 @@ logger = logging.getLogger(__name__)
 
 
 def debug_log(message: str, data: Dict[str, Any] = None):
-    """Simple debug logging function."""
+    """Simple debug logging function.
+
+    data may be a callable returning the dict, so costly details are only
+    built when INFO logging is enabled; formatting is left to logging.
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    if callable(data):
+        data = data()
     if data:
-        logger.info(f"{message}: {data}")
+        logger.info("%s: %s", message, data)
     else:
         logger.info(message)
 
@@ -450,6 +463,156 @@ def position_detail_api(isin):
         debug_log("Position detail API error", {"isin": isin, "error": str(e)})
         return jsonify({"error": str(e)}), 500
 
+
+# Hypothèses des projections, définies une fois au chargement du module
+DEFAULT_ANNUAL_RETURN = 0.07  # rendement utilisé quand le XIRR est indisponible
+TAX_RATES_BY_ACCOUNT = {"pea": 0.175, "cto": 0.30}  # fiscalité des gains par enveloppe
+OBJECTIVE_MAX_YEARS = 100  # horizon maximal d'un objectif (borne aussi la taille des graphiques)
+
+
+def _parse_number(value: Any, default: float) -> Optional[float]:
+    """Lit un nombre d'un corps JSON ; None si la valeur est invalide ou non finie.
+
+    Les nombres déjà typés par le parseur JSON sont acceptés sans conversion
+    texte ; seules les chaînes passent par float().
+    """
+    if value is None:
+        return float(default)
+    if isinstance(value, bool):
+        return None
+    if not isinstance(value, (int, float, str)):
+        return None
+    try:
+        number = float(value)
+    except (ValueError, OverflowError):
+        # OverflowError : entier JSON trop grand pour un float
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _projected_values(current_value: float, monthly_contribution: float,
+                      monthly_rate: float, months: np.ndarray) -> np.ndarray:
+    """Valeur projetée (capital + versements mensuels capitalisés) pour chaque mois."""
+    if monthly_rate > 0:
+        growth = (1 + monthly_rate) ** months
+        return current_value * growth + monthly_contribution * ((growth - 1) / monthly_rate)
+    return current_value + monthly_contribution * months
+
+
+@functools.lru_cache(maxsize=256)
+def _objective_projection(current_value: float, monthly_contribution: float,
+                          target_amount: float, target_year: int,
+                          current_year: int, rate: float,
+                          include_charts: bool = True) -> Dict[str, Any]:
+    """Projection de l'objectif (valeurs futures, effort requis, graphiques).
+
+    Fonction pure des paramètres : mise en cache pour que les rafraîchissements
+    du tableau de bord avec les mêmes paramètres ne recalculent rien. Le résultat
+    est partagé entre les appels : les séries sont des tuples, et l'appelant doit
+    copier les dictionnaires (y compris "chart" et "crossover") avant de les
+    modifier. L'horizon est borné par OBJECTIVE_MAX_YEARS, ce qui borne aussi la
+    taille d'une entrée du cache.
+    Avec include_charts=False, seuls les indicateurs de synthèse sont calculés.
+    """
+    years_remaining = max(0, target_year - current_year)
+
+    monthly_rate = rate / 12
+    n_months = years_remaining * 12
+
+    # Future value of current capital
+    fv_capital = current_value * ((1 + rate) ** years_remaining)
+
+    # Future value of monthly DCA contributions
+    if monthly_rate > 0 and n_months > 0:
+        fv_contributions = monthly_contribution * (((1 + monthly_rate) ** n_months - 1) / monthly_rate)
+    else:
+        fv_contributions = monthly_contribution * n_months
+
+    projected_value = fv_capital + fv_contributions
+
+    # Required monthly contribution to reach the target
+    remaining_needed = target_amount - fv_capital
+    if remaining_needed <= 0:
+        required_monthly = 0.0
+    elif monthly_rate > 0 and n_months > 0:
+        required_monthly = remaining_needed * monthly_rate / (((1 + monthly_rate) ** n_months) - 1)
+    elif n_months > 0:
+        required_monthly = remaining_needed / n_months
+    else:
+        required_monthly = remaining_needed
+
+    progress_pct = min(100.0, (current_value / target_amount * 100)) if target_amount > 0 else 0.0
+    on_track = projected_value >= target_amount
+
+    summary = {
+        "target_amount": float(target_amount),
+        "target_year": int(target_year),
+        "monthly_contribution": float(monthly_contribution),
+        "current_value": float(current_value),
+        "rate_used": round(float(rate * 100), 2),
+        "years_remaining": int(years_remaining),
+        "fv_capital": round(float(fv_capital), 2),
+        "fv_contributions": round(float(fv_contributions), 2),
+        "projected_value": round(float(projected_value), 2),
+        "required_monthly": round(float(max(0, required_monthly)), 2),
+        "progress_pct": round(float(progress_pct), 1),
+        "on_track": bool(on_track),
+        "surplus_or_deficit": round(float(projected_value - target_amount), 2),
+    }
+
+    if not include_charts:
+        return summary
+
+    # Une seule évaluation mois par mois, partagée par les deux graphiques
+    all_months = np.arange(0, int(n_months) + 1)
+    projected = _projected_values(current_value, monthly_contribution, monthly_rate, all_months)
+
+    # Monthly chart data (up to target date)
+    step_months = max(1, int(n_months) // 24)
+    months = all_months[::step_months]
+    # Capital investi cumulé = valeur actuelle + apports DCA futurs
+    invested = current_value + monthly_contribution * months
+    # Gains générés (projeté - investi)
+    interests = np.maximum(0.0, projected[::step_months] - invested)
+    # Calcul vectorisé, arrondi d'affichage avec round() : np.round multiplie
+    # par 10**décimales et peut différer sur certaines valeurs binaires
+    chart_labels = [round(year, 1) for year in (current_year + months / 12).tolist()]
+    chart_invested = [round(value, 2) for value in invested.tolist()]
+    chart_interests = [round(value, 2) for value in interests.tolist()]
+    chart_target = [float(target_amount)] * months.size
+
+    # Annual crossover chart: intérêts générés/an vs DCA/an
+    annual_dca = float(monthly_contribution) * 12
+    # n_months = 12 * years_remaining : un point tous les 12 mois = un point par an
+    years = np.arange(0, int(years_remaining) + 1)
+    annual_interests = projected[::12] * rate
+    crossover_labels = (current_year + years).tolist()
+    # Arrondi uniquement pour l'affichage : la comparaison se fait sur les valeurs exactes
+    annual_interests_chart = [round(value, 2) for value in annual_interests.tolist()]
+    annual_dca_chart = [round(annual_dca, 2)] * years.size
+    crossover_year = None
+    if annual_dca > 0:
+        crossed = np.flatnonzero(annual_interests >= annual_dca)
+        if crossed.size:
+            crossover_year = current_year + int(crossed[0])
+
+    return {
+        **summary,
+        "chart": {
+            "labels": tuple(chart_labels),
+            "invested": tuple(chart_invested),
+            "interests": tuple(chart_interests),
+            "target": tuple(chart_target),
+        },
+        "crossover": {
+            "labels": tuple(crossover_labels),
+            "annual_interests": tuple(annual_interests_chart),
+            "annual_dca": tuple(annual_dca_chart),
+            "crossover_year": crossover_year,
+        }
+    }
+
+
 @app.route("/api/objectif", methods=["GET", "POST"])
 @require_auth
 def objectif_api():
@@ -481,19 +644,28 @@ def objectif_api():
         avg_monthly_investment = None
         if user_orders:
             try:
-                dates = [datetime.strptime(o["date"], "%Y-%m-%d") for o in user_orders if o.get("date")]
-                if dates:
-                    first_date = min(dates)
-                    months_active = max(1, (datetime.now().year - first_date.year) * 12 + (datetime.now().month - first_date.month))
+                # Dates ISO (YYYY-MM-DD) : l'ordre lexical est l'ordre chronologique,
+                # seule la plus ancienne est parsée
+                first_date_str = min((o["date"] for o in user_orders if o.get("date")), default=None)
+                if first_date_str:
+                    first_date = date.fromisoformat(first_date_str)
+                    today = date.today()
+                    months_active = max(1, (today.year - first_date.year) * 12 + (today.month - first_date.month))
                     avg_monthly_investment = round(float(total_invested) / months_active, 2)
             except Exception:
                 pass
 
         if request.method == "POST":
             data = request.get_json() or {}
-            target_amount = float(data.get("target_amount", 0))
-            target_year = int(data.get("target_year", datetime.now().year + 10))
-            monthly_contribution = float(data.get("monthly_contribution", 0))
+            target_amount = _parse_number(data.get("target_amount"), 0.0)
+            target_year = _parse_number(data.get("target_year"), datetime.now().year + 10)
+            monthly_contribution = _parse_number(data.get("monthly_contribution"), 0.0)
+            current_year = datetime.now().year
+            if (target_amount is None or target_year is None or monthly_contribution is None
+                    or target_amount < 0 or monthly_contribution < 0
+                    or not current_year <= target_year <= current_year + OBJECTIVE_MAX_YEARS):
+                return jsonify({"success": False, "error": "Paramètres de l'objectif invalides"}), 400
+            target_year = int(target_year)
 
             objective = {
                 "target_amount": target_amount,
@@ -509,111 +681,28 @@ def objectif_api():
             target_amount = objective.get("target_amount", 0)
             target_year = objective.get("target_year", datetime.now().year + 10)
             monthly_contribution = objective.get("monthly_contribution", 0)
-            current_year = datetime.now().year
-            years_remaining = max(0, target_year - current_year)
 
             # Use XIRR if available, otherwise default to 7%
-            rate = (xirr / 100) if xirr and xirr > 0 else 0.07
-            monthly_rate = rate / 12
-            n_months = years_remaining * 12
-
-            # Future value of current capital
-            fv_capital = current_value * ((1 + rate) ** years_remaining)
-
-            # Future value of monthly DCA contributions
-            if monthly_rate > 0 and n_months > 0:
-                fv_contributions = monthly_contribution * (((1 + monthly_rate) ** n_months - 1) / monthly_rate)
-            else:
-                fv_contributions = monthly_contribution * n_months
-
-            projected_value = fv_capital + fv_contributions
-
-            # Required monthly contribution to reach the target
-            remaining_needed = target_amount - fv_capital
-            if remaining_needed <= 0:
-                required_monthly = 0.0
-            elif monthly_rate > 0 and n_months > 0:
-                required_monthly = remaining_needed * monthly_rate / (((1 + monthly_rate) ** n_months) - 1)
-            elif n_months > 0:
-                required_monthly = remaining_needed / n_months
-            else:
-                required_monthly = remaining_needed
-
-            progress_pct = min(100.0, (current_value / target_amount * 100)) if target_amount > 0 else 0.0
-            on_track = projected_value >= target_amount
-
-            # Monthly chart data (up to target date)
-            chart_labels = []
-            chart_invested = []   # capital réellement mis de poche
-            chart_interests = []  # gains générés (projeté - investi)
-            chart_target = []
-            step_months = max(1, int(n_months) // 24)
-            for m in range(0, int(n_months) + 1, step_months):
-                yr = current_year + m / 12
-                chart_labels.append(round(yr, 1))
-                # Capital investi cumulé = valeur actuelle + apports DCA futurs
-                invested_at_m = float(current_value) + float(monthly_contribution) * m
-                # Valeur projetée à ce mois
-                fvc = float(current_value) * ((1 + monthly_rate) ** m) if monthly_rate > 0 else float(current_value) * ((1 + rate) ** (m / 12))
-                if monthly_rate > 0 and m > 0:
-                    fvd = float(monthly_contribution) * (((1 + monthly_rate) ** m - 1) / monthly_rate)
-                else:
-                    fvd = float(monthly_contribution) * m
-                projected_at_m = fvc + fvd
-                interests_at_m = max(0.0, projected_at_m - invested_at_m)
-                chart_invested.append(round(invested_at_m, 2))
-                chart_interests.append(round(interests_at_m, 2))
-                chart_target.append(float(target_amount))
-
-            # Annual crossover chart: intérêts générés/an vs DCA/an
-            annual_dca = float(monthly_contribution) * 12
-            crossover_labels = []
-            annual_interests_chart = []
-            annual_dca_chart = []
-            crossover_year = None
-            for y in range(0, int(years_remaining) + 1):
-                m = y * 12
-                fvc = float(current_value) * ((1 + monthly_rate) ** m) if monthly_rate > 0 else float(current_value) * ((1 + rate) ** y)
-                if monthly_rate > 0 and m > 0:
-                    fvd = float(monthly_contribution) * (((1 + monthly_rate) ** m - 1) / monthly_rate)
-                else:
-                    fvd = float(monthly_contribution) * m
-                portfolio_at_y = fvc + fvd
-                interests_this_year = round(portfolio_at_y * rate, 2)
-                crossover_labels.append(current_year + y)
-                annual_interests_chart.append(interests_this_year)
-                annual_dca_chart.append(round(annual_dca, 2))
-                if crossover_year is None and interests_this_year >= annual_dca and annual_dca > 0:
-                    crossover_year = current_year + y
+            rate = (xirr / 100) if xirr and xirr > 0 else DEFAULT_ANNUAL_RETURN
+
+            # ?charts=0 : indicateurs seuls, sans les séries des graphiques
+            include_charts = request.args.get("charts", "1") != "0"
 
+            # Les objectifs enregistrés avant la validation des bornes sont ramenés
+            # dans l'horizon autorisé pour le calcul
+            current_year = datetime.now().year
+            target_year = min(int(target_year), current_year + OBJECTIVE_MAX_YEARS)
+
+            projection = _objective_projection(
+                float(current_value), float(monthly_contribution), float(target_amount),
+                target_year, current_year, float(rate), include_charts
+            )
+            # Copie du résultat en cache, sous-dictionnaires des graphiques compris
             progress = {
-                "target_amount": float(target_amount),
-                "target_year": int(target_year),
-                "monthly_contribution": float(monthly_contribution),
-                "current_value": float(current_value),
-                "xirr": float(xirr) if xirr is not None else None,
-                "rate_used": round(float(rate * 100), 2),
-                "years_remaining": int(years_remaining),
-                "fv_capital": round(float(fv_capital), 2),
-                "fv_contributions": round(float(fv_contributions), 2),
-                "projected_value": round(float(projected_value), 2),
-                "required_monthly": round(float(max(0, required_monthly)), 2),
-                "progress_pct": round(float(progress_pct), 1),
-                "on_track": bool(on_track),
-                "surplus_or_deficit": round(float(projected_value - target_amount), 2),
-                "chart": {
-                    "labels": chart_labels,
-                    "invested": chart_invested,
-                    "interests": chart_interests,
-                    "target": chart_target,
-                },
-                "crossover": {
-                    "labels": crossover_labels,
-                    "annual_interests": annual_interests_chart,
-                    "annual_dca": annual_dca_chart,
-                    "crossover_year": crossover_year,
-                }
+                key: dict(value) if isinstance(value, dict) else value
+                for key, value in projection.items()
             }
+            progress["xirr"] = float(xirr) if xirr is not None else None
 
         return jsonify({
             "success": True,
@@ -633,6 +722,59 @@ def objectif_api():
         return jsonify({"error": str(e)}), 500
 
 
+def _months_to_reach_capital(current_value: float, monthly_contribution: float,
+                             monthly_rate: float, required_capital: float,
+                             max_months: int = 1200):
+    """Premier mois m (1..max_months) où la valeur future atteint le capital requis.
+
+    FV(m) = V·g + C·(g - 1)/r avec g = (1 + r)^m, donc FV(m) >= K
+    équivaut à g >= (K + C/r) / (V + C/r) : on résout en log au lieu de
+    simuler mois par mois. Retourne None si l'objectif n'est jamais atteint
+    (ou hors de portée des flottants).
+    """
+    if not math.isfinite(required_capital):
+        return None
+
+    def future_value(m: int) -> float:
+        if monthly_rate > 0:
+            growth = (1 + monthly_rate) ** m
+            return current_value * growth + monthly_contribution * ((growth - 1) / monthly_rate)
+        return current_value + monthly_contribution * m
+
+    if future_value(1) >= required_capital:
+        return 1
+
+    if monthly_rate > 0:
+        annuity = monthly_contribution / monthly_rate
+        base = current_value + annuity
+        if base <= 0:
+            return None
+        ratio = (required_capital + annuity) / base
+        if not math.isfinite(ratio):
+            return None
+        months = 1 if ratio <= 1 else math.log(ratio) / math.log1p(monthly_rate)
+    elif monthly_contribution > 0:
+        months = (required_capital - current_value) / monthly_contribution
+    else:
+        months = 1
+
+    # Au-delà de l'horizon, inutile d'évaluer (1 + r)^m : il peut déborder
+    if not months <= max_months + 1:
+        return None
+    months = math.ceil(months)
+
+    # Corrige un éventuel écart d'arrondi flottant autour de la borne
+    months = max(1, months)
+    if months > 1 and future_value(months - 1) >= required_capital:
+        months -= 1
+    elif future_value(months) < required_capital:
+        months += 1
+
+    if months > max_months or future_value(months) < required_capital:
+        return None
+    return months
+
+
 @app.route("/api/revenu-passif", methods=["POST"])
 @require_auth
 def revenu_passif_api():
@@ -641,11 +783,13 @@ def revenu_passif_api():
         user_id = get_current_user_id()
         data = request.get_json() or {}
 
-        target_monthly_net = float(data.get("target_monthly_net", 0))
-        monthly_contribution = float(data.get("monthly_contribution", 0))
+        target_monthly_net = _parse_number(data.get("target_monthly_net"), 0.0)
+        monthly_contribution = _parse_number(data.get("monthly_contribution"), 0.0)
         account_type = data.get("account_type", "pea")
 
-        if target_monthly_net <= 0:
+        if monthly_contribution is None or monthly_contribution < 0:
+            return jsonify({"success": False, "error": "Versement mensuel invalide"}), 400
+        if target_monthly_net is None or target_monthly_net <= 0:
             return jsonify({"success": False, "error": "Revenu cible invalide"}), 400
 
         # Récupérer le portefeuille actuel
@@ -661,29 +805,23 @@ def revenu_passif_api():
         xirr = float(xirr_raw) if xirr_raw is not None else None
 
         # Taux fiscal selon le régime
-        tax_rates = {"pea": 0.175, "cto": 0.30}
-        tax_rate = tax_rates.get(account_type, 0.175)
+        tax_rate = TAX_RATES_BY_ACCOUNT.get(account_type, TAX_RATES_BY_ACCOUNT["pea"])
 
         # Taux de rendement annuel
-        rate = (xirr / 100) if xirr and xirr > 0 else 0.07
+        rate = (xirr / 100) if xirr and xirr > 0 else DEFAULT_ANNUAL_RETURN
         monthly_rate = rate / 12
 
         # Capital requis pour générer le revenu net mensuel cible
         target_monthly_gross = target_monthly_net / (1 - tax_rate)
         target_annual_gross = target_monthly_gross * 12
         required_capital = target_annual_gross / rate
+        if not math.isfinite(required_capital):
+            return jsonify({"success": False, "error": "Revenu cible invalide"}), 400
 
-        # Simuler mois par mois pour trouver quand on atteint le capital requis
-        months_to_reach = None
-        for m in range(1, 1201):  # max 100 ans
-            fv = current_value * ((1 + monthly_rate) ** m)
-            if monthly_rate > 0:
-                fv += monthly_contribution * (((1 + monthly_rate) ** m - 1) / monthly_rate)
-            else:
-                fv += monthly_contribution * m
-            if fv >= required_capital:
-                months_to_reach = m
-                break
+        # Premier mois où le capital requis est atteint (max 100 ans)
+        months_to_reach = _months_to_reach_capital(
+            current_value, monthly_contribution, monthly_rate, required_capital
+        )
 
         # Calculs pour l'affichage
         target_year = None
@@ -702,22 +840,15 @@ def revenu_passif_api():
         horizon_months = months_to_reach if months_to_reach else min(360, 240)
         chart_step = max(1, int(horizon_months) // 60)
         current_year = datetime.now().year
-        chart_labels = []
-        chart_invested = []
-        chart_interests = []
-        chart_target = []
-
-        for m in range(0, int(horizon_months) + 1, chart_step):
-            yr = current_year + m / 12
-            chart_labels.append(round(yr, 1))
-            invested_at_m = current_value + monthly_contribution * m
-            fvc = current_value * ((1 + monthly_rate) ** m) if monthly_rate > 0 else current_value
-            fvd = monthly_contribution * (((1 + monthly_rate) ** m - 1) / monthly_rate) if monthly_rate > 0 and m > 0 else monthly_contribution * m
-            projected_at_m = fvc + fvd
-            interests_at_m = max(0.0, projected_at_m - invested_at_m)
-            chart_invested.append(round(invested_at_m, 2))
-            chart_interests.append(round(interests_at_m, 2))
-            chart_target.append(round(required_capital, 2))
+        months = np.arange(0, int(horizon_months) + 1, chart_step)
+        invested = current_value + monthly_contribution * months
+        interests = np.maximum(
+            0.0, _projected_values(current_value, monthly_contribution, monthly_rate, months) - invested
+        )
+        chart_labels = [round(year, 1) for year in (current_year + months / 12).tolist()]
+        chart_invested = [round(value, 2) for value in invested.tolist()]
+        chart_interests = [round(value, 2) for value in interests.tolist()]
+        chart_target = [round(required_capital, 2)] * months.size
 
         return jsonify({
             "success": True,
@@ -855,8 +986,7 @@ def position_monthly_values_api(isin):
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/export/<export_type>", methods=["GET"])
-@require_auth
-@require_premium
+@require_premium_auth
 def export_data_api(export_type):
     """API endpoint pour exporter les données (premium uniquement)."""
     try:
@@ -951,7 +1081,7 @@ def create_checkout_session_api():
         cancel_url = f"{base_url}/subscription?canceled=true"
 
                 # Créer la session checkout
-        session_data = stripe_service.create_checkout_session(
+        session_data = get_stripe_service().create_checkout_session(
             user_id=user_id,
             email=user_info['email'],
             success_url=success_url,
@@ -990,14 +1120,13 @@ def sync_subscription_api():
         customer_id = subscription['stripe_customer_id']
 
                 # Récupérer les abonnements depuis Stripe (inclure les annulés)
-        import stripe
+        get_stripe_service()  # s'assure que stripe.api_key est configurée
         subscriptions = stripe.Subscription.list(customer=customer_id, limit=1)
 
         if subscriptions.data:
             stripe_sub = subscriptions.data[0]
 
                     # Déterminer le plan
-            from datetime import datetime
             plan = 'freemium'
 
                     # Check if subscription is FULLY cancelled (status = 'canceled')
@@ -1009,11 +1138,11 @@ def sync_subscription_api():
                     'status': 'canceled',
                     'stripe_customer_id': customer_id,
                     'stripe_subscription_id': None,
-                    'canceled_at': datetime.now()
+                    'canceled_at': datetime.now(timezone.utc)
                 }
 
                 if stripe_sub.get('current_period_end'):
-                    subscription_data['current_period_end'] = datetime.fromtimestamp(stripe_sub['current_period_end'])
+                    subscription_data['current_period_end'] = _from_timestamp(stripe_sub['current_period_end'])
 
                 firebase_service.update_user_subscription(user_id, subscription_data)
 
@@ -1039,12 +1168,12 @@ def sync_subscription_api():
                     'cancel_at_period_end': True,
                     'stripe_customer_id': customer_id,
                     'stripe_subscription_id': stripe_sub['id'],
-                    'current_period_start': datetime.fromtimestamp(stripe_sub['current_period_start']),
-                    'current_period_end': datetime.fromtimestamp(stripe_sub['current_period_end'])
+                    'current_period_start': _from_timestamp(stripe_sub['current_period_start']),
+                    'current_period_end': _from_timestamp(stripe_sub['current_period_end'])
                 }
 
                 if stripe_sub.get('trial_end'):
-                    subscription_data['trial_end'] = datetime.fromtimestamp(stripe_sub['trial_end'])
+                    subscription_data['trial_end'] = _from_timestamp(stripe_sub['trial_end'])
 
                 firebase_service.update_user_subscription(user_id, subscription_data)
 
@@ -1074,12 +1203,7 @@ def sync_subscription_api():
             }
 
                     # Ajouter les champs optionnels s'ils existent
-            if stripe_sub.get('current_period_start'):
-                subscription_data['current_period_start'] = datetime.fromtimestamp(stripe_sub['current_period_start'])
-            if stripe_sub.get('current_period_end'):
-                subscription_data['current_period_end'] = datetime.fromtimestamp(stripe_sub['current_period_end'])
-            if stripe_sub.get('trial_end'):
-                subscription_data['trial_end'] = datetime.fromtimestamp(stripe_sub['trial_end'])
+            subscription_data.update(_period_fields(stripe_sub))
 
             firebase_service.update_user_subscription(user_id, subscription_data)
 
@@ -1124,7 +1248,7 @@ def customer_portal_api():
         return_url = f"{base_url}/subscription"
 
                 # Créer la session portail
-        portal_url = stripe_service.create_customer_portal_session(
+        portal_url = get_stripe_service().create_customer_portal_session(
             user_id=user_id,
             return_url=return_url
         )
@@ -1180,7 +1304,7 @@ def cancel_subscription_api():
         user_id = get_current_user_id()
 
                 # Annuler l'abonnement (logique automatique : immédiat si essai, fin de période si payé)
-        success = stripe_service.cancel_subscription(user_id)
+        success = get_stripe_service().cancel_subscription(user_id)
 
         if success:
             return jsonify({
@@ -1205,7 +1329,7 @@ def stripe_webhook():
             return jsonify({"error": "Missing Stripe signature"}), 400
 
                 # Traiter le webhook
-        success = stripe_service.handle_webhook(payload, sig_header)
+        success = get_stripe_service().handle_webhook(payload, sig_header)
 
         if success:
             return jsonify({"status": "success"})
@@ -1294,7 +1418,7 @@ def _build_order_with_price(order_data: Dict[str, Any]) -> Dict[str, Any]:
     elif _positive(total) and quantity:
         unit = float(total) / quantity
     else:
-        order_date = datetime.strptime(order_data['date'], '%Y-%m-%d').date()
+        order_date = date.fromisoformat(order_data['date'])
         price_quote = price_service.get_historical_price(order_data['isin'], order_date)
         if not price_quote.is_valid:
             price_quote = price_service.get_current_price(order_data['isin'])
@@ -4,17 +4,31 @@ Consolidates all database and auth functionality in one place.
 """
 
 import os
+import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
+from types import MappingProxyType
 
 import json
 import base64
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
-from flask import request, jsonify, g
+from flask import Response, request, jsonify, g
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional, stdlib json accepts bytes too
+    _json_loads = json.loads
+
+# Local service account key used when FIREBASE_CREDENTIALS_JSON is not set (dev)
+SERVICE_ACCOUNT_PATH = Path(__file__).parent / "suivi-financ-firebase-adminsdk-fbsvc-6f17b62499.json"
 
 
 # ============================================================================
@@ -39,13 +53,12 @@ class FirebaseService:
             # Load credentials from env var (Cloud Run) or local file (dev)
             firebase_creds_json = os.environ.get("FIREBASE_CREDENTIALS_JSON")
             if firebase_creds_json:
-                creds_dict = json.loads(base64.b64decode(firebase_creds_json).decode("utf-8"))
+                creds_dict = _json_loads(base64.b64decode(firebase_creds_json))
                 cred = credentials.Certificate(creds_dict)
             else:
-                service_account_path = Path(__file__).parent / "suivi-financ-firebase-adminsdk-fbsvc-6f17b62499.json"
-                if not service_account_path.exists():
-                    raise FileNotFoundError(f"Service account key not found: {service_account_path}")
-                cred = credentials.Certificate(str(service_account_path))
+                if not SERVICE_ACCOUNT_PATH.exists():
+                    raise FileNotFoundError(f"Service account key not found: {SERVICE_ACCOUNT_PATH}")
+                cred = credentials.Certificate(str(SERVICE_ACCOUNT_PATH))
             firebase_admin.initialize_app(cred)
 
             # Get Firestore reference
@@ -148,18 +161,23 @@ class FirebaseService:
     def update_stripe_customer_id(self, user_id: str, stripe_customer_id: str) -> bool:
         """Update Stripe customer ID in both collections for consistency."""
         try:
+            # Both writes go in one batch: a single commit RPC, applied atomically
+            batch = self.db.batch()
+
             # Update customers collection (for Firebase Extension)
             customers_ref = self.db.collection('customers').document(user_id)
-            customers_ref.set({'stripeId': stripe_customer_id}, merge=True)
+            batch.set(customers_ref, {'stripeId': stripe_customer_id}, merge=True)
 
             # Also update users collection (for legacy code)
             user_ref = self.db.collection('users').document(user_id)
-            user_ref.set({
+            batch.set(user_ref, {
                 'subscription': {
                     'stripe_customer_id': stripe_customer_id
                 }
             }, merge=True)
 
+            batch.commit()
+
             logging.info(f"Updated Stripe customer ID for user {user_id}: {stripe_customer_id}")
             return True
 
@@ -172,6 +190,8 @@ class FirebaseService:
 
         Reads from customers/{uid}/subscriptions/ (Firebase Stripe Extension format).
         Returns the most recent active/trialing subscription, or None if no subscription.
+        Not cached across requests: a Stripe webhook handled by one worker must be
+        visible to all of them. Use _current_user_subscription within a request.
         """
         try:
             # Read from customers/{uid}/subscriptions/ collection
@@ -226,8 +246,11 @@ class FirebaseService:
         Important: If user is trialing and has requested cancellation (cancel_at is set),
         they lose access immediately (no payment made = no access).
         """
+        return self.is_subscription_premium(self.get_user_subscription(user_id), user_id)
+
+    def is_subscription_premium(self, subscription: Optional[Dict[str, Any]], user_id: str) -> bool:
+        """Premium rule of is_user_premium applied to an already fetched subscription."""
         try:
-            subscription = self.get_user_subscription(user_id)
             if not subscription:
                 return False
 
@@ -328,41 +351,93 @@ firebase_service = FirebaseService()
 # AUTHENTICATION MIDDLEWARE
 # ============================================================================
 
-def verify_firebase_token(token: str) -> Optional[Dict[str, Any]]:
+# Verified ID tokens are reused for a few minutes (never past their own expiry)
+# instead of re-checking the RSA signature on every request of a session
+TOKEN_CACHE_TTL_SECONDS = 300
+TOKEN_CACHE_MAX_ENTRIES = 4096
+# 16-byte token digest -> (expires_at, user_info), least recently used first
+# (keys stay small whatever the JWT length, and raw tokens are not kept in memory)
+_token_cache: 'OrderedDict[bytes, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+# Static 401 bodies serialized once; each response gets a fresh Response object
+_ERROR_TOKEN_REQUIRED = json.dumps({'error': 'Authentication token required'}).encode()
+_ERROR_INVALID_TOKEN = json.dumps({'error': 'Invalid or expired token'}).encode()
+_ERROR_AUTH_REQUIRED = json.dumps({'error': 'Authentication required'}).encode()
+
+
+def _unauthorized(body: bytes) -> Response:
+    """401 JSON response with a pre-serialized body."""
+    return Response(body, status=401, mimetype='application/json')
+
+
+def _strip_bearer(auth_header: str) -> str:
+    """Return the bare token of an Authorization header ("Bearer " prefix removed)."""
+    return auth_header[7:] if auth_header.startswith('Bearer ') else auth_header
+
+
+def verify_firebase_token(token: str, include_claims: bool = False) -> Optional[Dict[str, Any]]:
     """
     Verify a Firebase token and return user information.
 
     Args:
-        token: The Firebase token to verify
+        token: The bare Firebase ID token (see _strip_bearer for header values)
+        include_claims: Also return the full decoded token as 'firebase_claims'
+            (always re-verified: only uid/email are cached)
 
     Returns:
         Dict containing user info or None if invalid
     """
+    # Not a JWT (header.payload.signature): reject before any cache or crypto work
+    segments = token.split('.')
+    if len(segments) != 3 or not all(segments):
+        logging.warning("Malformed Firebase token")
+        return None
+
     try:
-        # Remove "Bearer " prefix if present
-        if token.startswith('Bearer '):
-            token = token[7:]
+        now = time.time()
+        cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        if not include_claims:
+            with _token_cache_lock:
+                cached = _token_cache.get(cache_key)
+                if cached is not None:
+                    if cached[0] > now:
+                        _token_cache.move_to_end(cache_key)
+                        return cached[1]
+                    del _token_cache[cache_key]
 
         # Verify token with Firebase Admin SDK (clock_skew_seconds tolère un léger décalage d'horloge)
         decoded_token = auth.verify_id_token(token, clock_skew_seconds=10)
 
-        return {
+        user_info = {
             'uid': decoded_token['uid'],
             'email': decoded_token.get('email'),
-            'email_verified': decoded_token.get('email_verified', False),
-            'firebase_claims': decoded_token
+            'email_verified': decoded_token.get('email_verified', False)
         }
 
-    except firebase_admin.auth.InvalidIdTokenError as e:
-        logging.warning(f"Invalid Firebase token: {e}")
-        return None
-    except firebase_admin.auth.ExpiredIdTokenError as e:
+        expires_at = min(now + TOKEN_CACHE_TTL_SECONDS, decoded_token.get('exp', now))
+        with _token_cache_lock:
+            _token_cache[cache_key] = (expires_at, user_info)
+            _token_cache.move_to_end(cache_key)
+            while len(_token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+                _token_cache.popitem(last=False)
+
+        if include_claims:
+            return {**user_info, 'firebase_claims': decoded_token}
+        return user_info
+
+    # Expired/Revoked subclass InvalidIdTokenError: they must be caught first
+    except auth.ExpiredIdTokenError as e:
         logging.warning(f"Expired Firebase token: {e}")
         return None
-    except firebase_admin.auth.RevokedIdTokenError:
+    except auth.RevokedIdTokenError:
         logging.warning("Revoked Firebase token")
         return None
-    except Exception as e:
+    except auth.InvalidIdTokenError as e:
+        logging.warning(f"Invalid Firebase token: {e}")
+        return None
+    except (ValueError, auth.CertificateFetchError) as e:
+        # Malformed token value, or Google public keys unreachable
         logging.error(f"Token verification error: {e}")
         return None
 
@@ -373,25 +448,33 @@ def require_auth(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
+        error = _authenticate_request()
+        if error is not None:
+            return error
+
+        return f(*args, **kwargs)
 
-        if not auth_header:
-            return jsonify({'error': 'Authentication token required'}), 401
+    return decorated_function
 
-        # Verify token
-        user_info = verify_firebase_token(auth_header)
 
-        if not user_info:
-            return jsonify({'error': 'Invalid or expired token'}), 401
+def _authenticate_request():
+    """Verify the request's token and store the user on g; returns an error response or None."""
+    # Get token from Authorization header
+    auth_header = request.headers.get('Authorization')
 
-        # Store user info in g for use in the route
-        g.current_user = user_info
-        g.user_id = user_info['uid']
+    if not auth_header:
+        return _unauthorized(_ERROR_TOKEN_REQUIRED)
 
-        return f(*args, **kwargs)
+    # Verify token
+    user_info = verify_firebase_token(_strip_bearer(auth_header))
 
-    return decorated_function
+    if not user_info:
+        return _unauthorized(_ERROR_INVALID_TOKEN)
+
+    # Store user info in g for use in the route
+    g.current_user = user_info
+    g.user_id = user_info['uid']
+    return None
 
 
 def get_current_user_id() -> Optional[str]:
@@ -401,7 +484,7 @@ def get_current_user_id() -> Optional[str]:
     Returns:
         User ID or None if not authenticated
     """
-    return getattr(g, 'user_id', None)
+    return g.get('user_id')
 
 
 def get_current_user() -> Optional[Dict[str, Any]]:
@@ -411,7 +494,7 @@ def get_current_user() -> Optional[Dict[str, Any]]:
     Returns:
         Dict with user info or None if not authenticated
     """
-    return getattr(g, 'current_user', None)
+    return g.get('current_user')
 
 
 def is_user_authenticated() -> bool:
@@ -421,14 +504,34 @@ def is_user_authenticated() -> bool:
     Returns:
         True if user is authenticated, False otherwise
     """
+    # Already verified by @require_auth for this request
+    if get_current_user() is not None:
+        return True
+
     auth_header = request.headers.get('Authorization')
     if not auth_header:
         return False
 
-    user_info = verify_firebase_token(auth_header)
+    user_info = verify_firebase_token(_strip_bearer(auth_header))
     return user_info is not None
 
 
+def _current_user_subscription(user_id: str) -> Optional[Dict[str, Any]]:
+    """Subscription of the request's user, read from Firestore once per request."""
+    if 'subscription' not in g:
+        g.subscription = firebase_service.get_user_subscription(user_id)
+    return g.subscription
+
+
+def _is_current_user_premium(user_id: str) -> bool:
+    """Premium status of the request's user, derived from its cached subscription."""
+    is_premium = g.get('is_premium')
+    if is_premium is None:
+        is_premium = firebase_service.is_subscription_premium(_current_user_subscription(user_id), user_id)
+        g.is_premium = is_premium
+    return is_premium
+
+
 def require_premium(f):
     """
     Decorator to protect routes requiring premium subscription.
@@ -438,45 +541,80 @@ def require_premium(f):
     @require_premium
     def my_premium_route():
         pass
+
+    or use @require_premium_auth, which does both in one wrapper.
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
         # Check user is authenticated (should be called after @require_auth)
         user_id = get_current_user_id()
         if not user_id:
-            return jsonify({'error': 'Authentication required'}), 401
-
-        # Check premium status
-        is_premium = firebase_service.is_user_premium(user_id)
-
-        if not is_premium:
-            # Get subscription info for more details
-            subscription = firebase_service.get_user_subscription(user_id)
-
-            # Determine plan from subscription status
-            if subscription:
-                status = subscription.get('status')
-                if status == 'trialing':
-                    plan = 'trial'
-                elif status == 'active':
-                    plan = 'premium'
-                else:
-                    plan = 'freemium'
-            else:
-                plan = 'freemium'
+            return _unauthorized(_ERROR_AUTH_REQUIRED)
 
-            return jsonify({
-                'error': 'Premium subscription required',
-                'error_type': 'premium_required',
-                'current_plan': plan,
-                'message': 'This feature requires a premium subscription.'
-            }), 403
+        error = _premium_required_error(user_id)
+        if error is not None:
+            return error
 
         return f(*args, **kwargs)
 
     return decorated_function
 
 
+def require_premium_auth(f):
+    """
+    Decorator combining @require_auth and @require_premium in a single wrapper.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        error = _authenticate_request()
+        if error is None:
+            error = _premium_required_error(g.user_id)
+        if error is not None:
+            return error
+
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+def _premium_required_error(user_id: str):
+    """Return the 403 response for a non-premium user, or None if premium."""
+    # Check premium status
+    if _is_current_user_premium(user_id):
+        return None
+
+    # Get subscription info for more details
+    subscription = _current_user_subscription(user_id)
+
+    # Determine plan from subscription status
+    if subscription:
+        status = subscription.get('status')
+        if status == 'trialing':
+            plan = 'trial'
+        elif status == 'active':
+            plan = 'premium'
+        else:
+            plan = 'freemium'
+    else:
+        plan = 'freemium'
+
+    return jsonify({
+        'error': 'Premium subscription required',
+        'error_type': 'premium_required',
+        'current_plan': plan,
+        'message': 'This feature requires a premium subscription.'
+    }), 403
+
+
+# Limits applied to freemium users by @check_freemium_limits (shared, read-only)
+FREEMIUM_FEATURE_LIMITS = MappingProxyType({
+    'dashboard_periods': ('1m',),  # Only 1 month
+    'position_analysis': 1,        # 1 position only
+    'projections_type': 'current_only',  # Current capital only
+    'export_formats': ('json',)    # JSON only
+})
+
+
 def check_freemium_limits(feature: str, limit_value: int = None):
     """
     Decorator to check freemium limits on certain features.
@@ -490,10 +628,10 @@ def check_freemium_limits(feature: str, limit_value: int = None):
         def decorated_function(*args, **kwargs):
             user_id = get_current_user_id()
             if not user_id:
-                return jsonify({'error': 'Authentication required'}), 401
+                return _unauthorized(_ERROR_AUTH_REQUIRED)
 
             # Check if user is premium
-            is_premium = firebase_service.is_user_premium(user_id)
+            is_premium = _is_current_user_premium(user_id)
 
             if is_premium:
                 return f(*args, **kwargs)
@@ -501,12 +639,7 @@ def check_freemium_limits(feature: str, limit_value: int = None):
             # Apply freemium limitations
             # Add limitation information to request
             g.is_freemium = True
-            g.feature_limits = {
-                'dashboard_periods': ['1m'],  # Only 1 month
-                'position_analysis': 1,       # 1 position only
-                'projections_type': 'current_only',  # Current capital only
-                'export_formats': ['json']    # JSON only
-            }
+            g.feature_limits = FREEMIUM_FEATURE_LIMITS
 
             return f(*args, **kwargs)
 
@@ -527,7 +660,7 @@ def get_user_plan_info() -> Optional[Dict[str, Any]]:
     if not user_id:
         return None
 
-    subscription = firebase_service.get_user_subscription(user_id)
+    subscription = _current_user_subscription(user_id)
 
     if not subscription:
         return {
@@ -540,7 +673,7 @@ def get_user_plan_info() -> Optional[Dict[str, Any]]:
         }
 
     status = subscription.get('status')
-    is_premium = firebase_service.is_user_premium(user_id)
+    is_premium = _is_current_user_premium(user_id)
 
     # Determine plan type based on is_premium flag (not just status)
     # This ensures that cancelled trials show as freemium
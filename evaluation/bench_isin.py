@@ -55,26 +55,27 @@ def main() -> None:
 
     per_strategy = {s: _run(s) for s in strategies}
 
-    # Tableau récapitulatif
-    print("\n# Banc d'essai résolution ISIN\n")
-    print("| Stratégie | Exactitude | Corrects |")
-    print("|---|---|---|")
+    # Tableau récapitulatif, assemblé puis écrit en une fois
+    n = len(DATASET)
+    lines = [
+        "\n# Banc d'essai résolution ISIN\n",
+        "| Stratégie | Exactitude | Corrects |",
+        "|---|---|---|",
+    ]
     for s in strategies:
         ok = sum(per_strategy[s])
-        n = len(DATASET)
-        print(f"| {s} | {ok / n:.0%} | {ok}/{n} |")
+        lines.append(f"| {s} | {ok / n:.0%} | {ok}/{n} |")
 
     # Détail par requête (montre où embeddings rattrape le TF-IDF)
-    print("\n## Détail par requête\n")
-    header = "| Requête | Attendu | " + " | ".join(strategies) + " |"
-    print(header)
-    print("|" + "---|" * (len(strategies) + 2))
+    lines.append("\n## Détail par requête\n")
+    lines.append("| Requête | Attendu | " + " | ".join(strategies) + " |")
+    lines.append("|" + "---|" * (len(strategies) + 2))
     for idx, (query, expected, diff) in enumerate(DATASET):
-        cells = []
-        for s in strategies:
-            cells.append("✅" if per_strategy[s][idx] else "❌")
+        cells = ["✅" if per_strategy[s][idx] else "❌" for s in strategies]
         q = query if len(query) <= 38 else query[:35] + "…"
-        print(f"| {q} ({diff}) | {expected} | " + " | ".join(cells) + " |")
+        lines.append(f"| {q} ({diff}) | {expected} | " + " | ".join(cells) + " |")
+
+    print("\n".join(lines))
 
 
 if __name__ == "__main__":
@@ -225,7 +225,7 @@ class PriceQuote:
 # PROJECTION MODELS
 # ============================================================================
 
-@dataclass
+@dataclass(slots=True)
 class ProjectionScenario:
     """Represents a financial projection scenario."""
     name: str
@@ -234,7 +234,7 @@ class ProjectionScenario:
     description: str
 
 
-@dataclass
+@dataclass(slots=True)
 class ProjectionParams:
     """Parameters for portfolio projection."""
     current_value: float
@@ -243,7 +243,7 @@ class ProjectionParams:
     annual_fees_rate: float = 0.0075  # 0.75% annual fees
 
 
-@dataclass
+@dataclass(slots=True)
 class ProjectionResult:
     """Result of a portfolio projection."""
     scenario_name: str
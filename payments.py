@@ -5,12 +5,36 @@ Handles checkout, webhooks, and subscription lifecycle.
 
 import os
 import logging
+import threading
 import stripe
 from typing import Dict, Any, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 
 from database import firebase_service
 
+# Verbose webhook payload logging, off in production
+_DEBUG = os.environ.get('DEBUG_LOGS') == '1'
+
+# Stripe timestamp fields copied onto the Firebase subscription document
+_PERIOD_FIELDS = ('current_period_start', 'current_period_end', 'trial_end')
+
+
+def _from_timestamp(timestamp: Optional[int]) -> Optional[datetime]:
+    """Convert a Stripe epoch timestamp to an aware UTC datetime (None if unset)."""
+    if not timestamp:
+        return None
+    # Explicit UTC skips the local-time conversion and stores the exact instant
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def _period_fields(subscription) -> Dict[str, datetime]:
+    """Return the period/trial datetimes present on a Stripe subscription."""
+    return {
+        field: _from_timestamp(subscription[field])
+        for field in _PERIOD_FIELDS
+        if subscription.get(field)
+    }
+
 
 class StripeService:
     """Service for managing Stripe subscriptions and payments."""
@@ -171,7 +195,7 @@ class StripeService:
                     'status': 'canceled',
                     'stripe_customer_id': subscription.get('stripe_customer_id'),
                     'stripe_subscription_id': None,
-                    'canceled_at': datetime.now(),
+                    'canceled_at': datetime.now(timezone.utc),
                     'trial_start': None,
                     'trial_end': None
                 }
@@ -263,12 +287,7 @@ class StripeService:
             }
 
             # Add optional fields safely
-            if subscription.get('current_period_start'):
-                subscription_data['current_period_start'] = datetime.fromtimestamp(subscription['current_period_start'])
-            if subscription.get('current_period_end'):
-                subscription_data['current_period_end'] = datetime.fromtimestamp(subscription['current_period_end'])
-            if subscription.get('trial_end'):
-                subscription_data['trial_end'] = datetime.fromtimestamp(subscription['trial_end'])
+            subscription_data.update(_period_fields(subscription))
 
             firebase_service.update_user_subscription(user_id, subscription_data)
 
@@ -285,12 +304,15 @@ class StripeService:
                 logging.warning("No user ID in subscription metadata")
                 return
 
-            # DEBUG: Log subscription details
-            print(f"=== SUBSCRIPTION UPDATED ===")
-            print(f"User ID: {user_id}")
-            print(f"Status: {subscription['status']}")
-            print(f"cancel_at_period_end: {subscription.get('cancel_at_period_end', False)}")
-            print(f"canceled_at: {subscription.get('canceled_at')}")
+            # DEBUG: Log subscription details (only when DEBUG_LOGS=1)
+            if _DEBUG:
+                logging.info(
+                    "Subscription updated: user=%s status=%s cancel_at_period_end=%s canceled_at=%s",
+                    user_id,
+                    subscription['status'],
+                    subscription.get('cancel_at_period_end', False),
+                    subscription.get('canceled_at'),
+                )
 
             # Check if subscription is FULLY cancelled (status = 'canceled')
             # This happens when trial is cancelled immediately
@@ -301,8 +323,8 @@ class StripeService:
                     'status': 'canceled',
                     'stripe_customer_id': subscription['customer'],
                     'stripe_subscription_id': None,
-                    'canceled_at': datetime.now(),
-                    'current_period_end': datetime.fromtimestamp(subscription['current_period_end']) if subscription.get('current_period_end') else None
+                    'canceled_at': datetime.now(timezone.utc),
+                    'current_period_end': _from_timestamp(subscription.get('current_period_end'))
                 }
 
                 firebase_service.update_user_subscription(user_id, subscription_data)
@@ -331,7 +353,7 @@ class StripeService:
                             'status': 'canceled',
                             'stripe_customer_id': subscription['customer'],
                             'stripe_subscription_id': None,
-                            'canceled_at': datetime.now()
+                            'canceled_at': datetime.now(timezone.utc)
                         }
                         firebase_service.update_user_subscription(user_id, subscription_data)
                         logging.info(f"Trial subscription IMMEDIATELY cancelled for user {user_id}")
@@ -351,12 +373,7 @@ class StripeService:
                 }
 
                 # Add optional fields safely
-                if subscription.get('current_period_start'):
-                    subscription_data['current_period_start'] = datetime.fromtimestamp(subscription['current_period_start'])
-                if subscription.get('current_period_end'):
-                    subscription_data['current_period_end'] = datetime.fromtimestamp(subscription['current_period_end'])
-                if subscription.get('trial_end'):
-                    subscription_data['trial_end'] = datetime.fromtimestamp(subscription['trial_end'])
+                subscription_data.update(_period_fields(subscription))
 
                 firebase_service.update_user_subscription(user_id, subscription_data)
                 logging.info(f"Paid subscription scheduled for cancellation for user {user_id} - access until period end")
@@ -380,12 +397,7 @@ class StripeService:
             }
 
             # Add optional fields safely
-            if subscription.get('current_period_start'):
-                subscription_data['current_period_start'] = datetime.fromtimestamp(subscription['current_period_start'])
-            if subscription.get('current_period_end'):
-                subscription_data['current_period_end'] = datetime.fromtimestamp(subscription['current_period_end'])
-            if subscription.get('trial_end'):
-                subscription_data['trial_end'] = datetime.fromtimestamp(subscription['trial_end'])
+            subscription_data.update(_period_fields(subscription))
 
             firebase_service.update_user_subscription(user_id, subscription_data)
 
@@ -421,16 +433,29 @@ class StripeService:
         except Exception as e:
             logging.error(f"Error handling customer.subscription.deleted: {e}")
 
+    def _get_invoice_user_id(self, invoice) -> Optional[str]:
+        """Return the Firebase UID of the subscription an invoice belongs to.
+
+        Stripe copies the subscription metadata onto the invoice, so the
+        subscription is only retrieved from the API when it is missing.
+        """
+        subscription_id = invoice.get('subscription')
+        if not subscription_id:
+            return None
+
+        subscription_details = invoice.get('subscription_details') or {}
+        user_id = (subscription_details.get('metadata') or {}).get('firebase_uid')
+        if user_id:
+            return user_id
+
+        # Retrieve subscription to get user ID
+        subscription = stripe.Subscription.retrieve(subscription_id)
+        return subscription['metadata'].get('firebase_uid')
+
     def _handle_payment_succeeded(self, invoice):
         """Handle successful payment."""
         try:
-            subscription_id = invoice.get('subscription')
-            if not subscription_id:
-                return
-
-            # Retrieve subscription to get user ID
-            subscription = stripe.Subscription.retrieve(subscription_id)
-            user_id = subscription['metadata'].get('firebase_uid')
+            user_id = self._get_invoice_user_id(invoice)
 
             if user_id:
                 logging.info(f"Payment succeeded for user {user_id}: {invoice['amount_paid']} cents")
@@ -441,13 +466,7 @@ class StripeService:
     def _handle_payment_failed(self, invoice):
         """Handle failed payment."""
         try:
-            subscription_id = invoice.get('subscription')
-            if not subscription_id:
-                return
-
-            # Retrieve subscription to get user ID
-            subscription = stripe.Subscription.retrieve(subscription_id)
-            user_id = subscription['metadata'].get('firebase_uid')
+            user_id = self._get_invoice_user_id(invoice)
 
             if user_id:
                 logging.warning(f"Payment failed for user {user_id}: {invoice['amount_due']} cents")
@@ -456,5 +475,24 @@ class StripeService:
             logging.error(f"Error handling invoice.payment_failed: {e}")
 
 
-# Global instance
-stripe_service = StripeService()
+# Global instance, created on first use so importing this module does not
+# configure Stripe (CLI scripts, tooling)
+_stripe_service: Optional[StripeService] = None
+_stripe_service_lock = threading.Lock()
+
+
+def get_stripe_service() -> StripeService:
+    """Return the shared StripeService, creating it on first call."""
+    global _stripe_service
+    if _stripe_service is None:
+        with _stripe_service_lock:
+            if _stripe_service is None:
+                _stripe_service = StripeService()
+    return _stripe_service
+
+
+def __getattr__(name: str):
+    # Keeps `payments.stripe_service` working for existing callers
+    if name == "stripe_service":
+        return get_stripe_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,28 +2,46 @@
 Script de migration des ordres depuis orders.json vers Firebase
 pour un utilisateur spécifique
 """
+import functools
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime
 import uuid
+from pathlib import Path
 
-# Configuration Firebase
 try:
-    # Tenter d'obtenir l'app existante
-    app = firebase_admin.get_app()
-except ValueError:
-    # Si l'app n'existe pas, l'initialiser
-    cred = credentials.Certificate('suivi-financ-firebase-adminsdk-fbsvc-6f17b62499.json')
-    app = firebase_admin.initialize_app(cred)
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson est optionnel, json accepte aussi des bytes
+    _json_loads = json.loads
 
-db = firestore.client()
+# Clé du compte de service, résolue depuis la racine du dépôt (et non le cwd)
+SERVICE_ACCOUNT_PATH = Path(__file__).resolve().parent.parent / "suivi-financ-firebase-adminsdk-fbsvc-6f17b62499.json"
+
+
+@functools.lru_cache(maxsize=None)
+def get_db():
+    """Client Firestore, initialisé au premier appel (import de firebase_admin compris).
+
+    Importer le script (ou lancer une étape sans Firestore, comme la lecture
+    d'orders.json) ne paie ni l'import du SDK ni l'initialisation.
+    """
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    try:
+        # Tenter d'obtenir l'app existante
+        firebase_admin.get_app()
+    except ValueError:
+        # Si l'app n'existe pas, l'initialiser
+        cred = credentials.Certificate(str(SERVICE_ACCOUNT_PATH))
+        firebase_admin.initialize_app(cred)
+
+    return firestore.client()
 
 def load_orders_from_json():
     """Charge les ordres depuis le fichier orders.json"""
     try:
-        with open('orders.json', 'r', encoding='utf-8') as f:
-            orders = json.load(f)
+        orders = _json_loads(Path('orders.json').read_bytes())
         print(f"✅ {len(orders)} ordres chargés depuis orders.json")
         return orders
     except Exception as e:
@@ -34,7 +52,7 @@ def delete_user_orders(user_id):
     """Supprime tous les ordres existants d'un utilisateur dans Firebase"""
     try:
         # Référence de la collection orders de l'utilisateur
-        user_orders_ref = db.collection('users').document(user_id).collection('orders')
+        user_orders_ref = get_db().collection('users').document(user_id).collection('orders')
 
         # Récupérer tous les documents
         orders = user_orders_ref.stream()
@@ -54,7 +72,7 @@ def add_orders_to_firebase(user_id, orders):
     """Ajoute les ordres dans Firebase pour un utilisateur spécifique"""
     try:
         # Référence de la collection orders de l'utilisateur
-        user_orders_ref = db.collection('users').document(user_id).collection('orders')
+        user_orders_ref = get_db().collection('users').document(user_id).collection('orders')
 
         added_count = 0
         for order in orders:
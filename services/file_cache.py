@@ -0,0 +1,73 @@
+"""
+File-based cache for external API responses.
+Stores JSON blobs on disk so price histories survive process restarts.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+
+class FileCache:
+    """Persistent JSON cache keyed on (namespace, endpoint, params) with a TTL."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, namespace: str, endpoint: str, params: Any) -> Optional[Path]:
+        """Return the cache file for a key, or None if the namespace is unsafe."""
+        if not namespace.isalnum():
+            return None
+        digest = hashlib.md5(
+            json.dumps(params, sort_keys=True, default=str).encode(),
+            usedforsecurity=False
+        ).hexdigest()
+        return self.root / namespace / f"{endpoint}-{digest}.json"
+
+    def get(self, namespace: str, endpoint: str, params: Any, ttl_seconds: float) -> Optional[Any]:
+        """Return the cached data if it is younger than the TTL, else None."""
+        entry = self.get_with_age(namespace, endpoint, params, ttl_seconds)
+        return entry[0] if entry is not None else None
+
+    def get_with_age(
+        self, namespace: str, endpoint: str, params: Any, ttl_seconds: float
+    ) -> Optional[Tuple[Any, float]]:
+        """Return (data, age in seconds) if the entry is younger than the TTL, else None."""
+        path = self._path(namespace, endpoint, params)
+        if path is None:
+            return None
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        age = time.time() - entry.get("ts", 0)
+        if age > ttl_seconds:
+            return None
+        return entry.get("data"), age
+
+    def set(self, namespace: str, endpoint: str, params: Any, data: Any) -> bool:
+        """Write data to the cache atomically. Returns False if it could not be stored."""
+        path = self._path(namespace, endpoint, params)
+        if path is None:
+            return False
+
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"ts": time.time(), "data": data}, f)
+            os.replace(tmp_path, path)
+            return True
+        except (OSError, TypeError, ValueError):
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return False
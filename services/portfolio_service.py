@@ -2,10 +2,14 @@
 Service for portfolio management operations including performance calculations and data aggregation.
 """
 
+import bisect
+import calendar
+import functools
 import json
+import operator
 from datetime import datetime, date
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 from scipy.optimize import fsolve
 import yfinance as yf
@@ -16,6 +20,58 @@ from models import (
 from services.price_service import PriceService
 
 
+# Month names resolved once instead of one strftime("%B") per generated month
+_MONTH_NAMES = tuple(calendar.month_name)
+
+
+_order_date = operator.attrgetter("order_date")
+
+
+@functools.lru_cache(maxsize=64)
+def _month_starts(first_day: date, last_day: date) -> Tuple[date, ...]:
+    """Return the first day of every month from first_day's month to last_day's month.
+
+    Cached: the monthly portfolio and position series of a user share the
+    same range for the whole day. A tuple so the cached value cannot be mutated.
+    """
+    # Months counted from year 0, so the year/month rollover is a single divmod
+    first_index = first_day.year * 12 + first_day.month - 1
+    last_index = last_day.year * 12 + last_day.month - 1
+    return tuple(
+        date(year, month + 1, 1)
+        for year, month in (divmod(index, 12) for index in range(first_index, last_index + 1))
+    )
+
+
+def _month_label_fields(year: int, month: int) -> Dict[str, str]:
+    """Return the month key, display label and ISO first-day date for a month."""
+    key = f"{year:04d}-{month:02d}"
+    return {
+        "month": key,
+        "month_display": f"{_MONTH_NAMES[month]} {year}",
+        "date": f"{key}-01",
+    }
+
+
+def _accumulate_positions(
+    isin_positions: Dict[str, Dict[str, float]],
+    orders: List[InvestmentOrder]
+) -> None:
+    """Add orders to a {isin: {'quantity', 'total_invested'}} mapping in place."""
+    for order in orders:
+        position = isin_positions.get(order.isin)
+        if position is None:
+            position = isin_positions[order.isin] = {
+                'quantity': 0.0,
+                'total_invested': 0.0
+            }
+
+        # For now, treat all orders as buy orders (consistent with rest of codebase)
+        # TODO: Add proper buy/sell support once order_type is added to InvestmentOrder model
+        position['quantity'] += order.quantity
+        position['total_invested'] += order.total_price_eur
+
+
 class PortfolioService:
     """Service for managing portfolio data and calculations."""
     
@@ -259,9 +315,13 @@ class PortfolioService:
             dates = []
             
             # Add investment outflows (negative values)
+            total_invested = 0.0
             for order in orders:
                 cash_flows.append(-order.total_price_eur)
                 dates.append(order.order_date)
+                total_invested += order.total_price_eur
+            # Overall growth factor, shared by the XIRR and simplified paths
+            growth = current_value / total_invested
             
             # Add current value as final inflow (positive value)
             cash_flows.append(current_value)
@@ -284,7 +344,7 @@ class PortfolioService:
                 # Validate the result
                 if abs(xirr_equation(annual_rate)) < 1e-6 and -0.99 < annual_rate < 10:  # Reasonable bounds
                     annual_return_pct = annual_rate * 100
-                    total_return_pct = ((current_value / sum(-cf for cf in cash_flows[:-1])) - 1) * 100
+                    total_return_pct = (growth - 1) * 100
                     
                     # Prepare calculation details
                     calculation_details = []
@@ -319,8 +379,8 @@ class PortfolioService:
                 total_days = (dates[-1] - dates[0]).days
                 years = total_days / 365.25
                 if years > 0:
-                    total_return_pct = ((current_value / sum(-cf for cf in cash_flows[:-1])) - 1) * 100
-                    annual_return_pct = ((current_value / sum(-cf for cf in cash_flows[:-1])) ** (1/years) - 1) * 100
+                    total_return_pct = (growth - 1) * 100
+                    annual_return_pct = (growth ** (1 / years) - 1) * 100
                     
                     return PerformanceMetrics(
                         annual_return_percentage=annual_return_pct,
@@ -419,14 +479,15 @@ class PortfolioService:
         orders.sort(key=lambda o: o.order_date)
 
         # OPTIMISATION BATCH PRICING: Pré-charger tous les prix historiques
-        unique_isins = list(set(order.isin for order in orders))
+        # dict.fromkeys dedupes in first-order order, so the batch request is deterministic
+        unique_isins = list(dict.fromkeys(order.isin for order in orders))
         self._log("Batch pricing: fetching prices for all ISINs", {"isins_count": len(unique_isins)})
 
         batch_prices = self.price_service.fetch_batch_historical_prices(unique_isins, max_workers=5)
 
         self._log("Batch pricing completed", {
             "isins_fetched": len(batch_prices),
-            "successful": sum(1 for p in batch_prices.values() if p)
+            "successful": sum(1 for series in batch_prices.values() if len(series))
         })
 
         # Find the first order date to determine starting month
@@ -437,18 +498,28 @@ class PortfolioService:
         current_date = date.today()
         current_month = date(current_date.year, current_date.month, 1)
 
+        month_starts = _month_starts(first_month, current_month)
+
+        # OPTIMISATION: prix batch de tous les ISINs à tous les mois en une seule
+        # recherche vectorisée par ISIN, au lieu d'une recherche par (mois, ISIN)
+        price_matrix = self.price_service.get_price_matrix_from_batch(unique_isins, month_starts)
+
         monthly_values = []
-        month_iter = first_month
 
-        while month_iter <= current_month:
-            month_first_day = month_iter
+        # Positions are carried from month to month: each order is applied once,
+        # in date order, instead of regrouping all earlier orders every month
+        running_positions: Dict[str, Dict[str, float]] = {}
+        applied = 0
+
+        for month_first_day, month_prices in zip(month_starts, price_matrix.T.tolist()):
+            month_cutoff = bisect.bisect_left(orders, month_first_day, lo=applied, key=_order_date)
+            _accumulate_positions(running_positions, orders[applied:month_cutoff])
+            applied = month_cutoff
 
             # For the very first month (month of first order), value is 0
-            if month_iter == first_month:
+            if month_first_day == first_month:
                 monthly_values.append({
-                    "month": month_first_day.strftime("%Y-%m"),
-                    "month_display": month_first_day.strftime("%B %Y"),
-                    "date": month_first_day.isoformat(),
+                    **_month_label_fields(month_first_day.year, month_first_day.month),
                     "portfolio_value": 0.0,
                     "invested_capital": 0.0,
                     "plus_minus_values": 0.0,
@@ -458,16 +529,16 @@ class PortfolioService:
                 })
             else:
                 # Calculate portfolio value at the beginning of this month
-                portfolio_value, invested_capital, positions = self._calculate_portfolio_value_at_date(orders, month_first_day)
+                portfolio_value, invested_capital, positions = self._value_positions(
+                    running_positions, month_first_day, dict(zip(unique_isins, month_prices))
+                )
 
                 # Calculate +/- values (profit/loss)
                 plus_minus_values = portfolio_value - invested_capital
                 plus_minus_values_pct = (plus_minus_values / invested_capital * 100) if invested_capital > 0 else 0
 
                 monthly_values.append({
-                    "month": month_first_day.strftime("%Y-%m"),
-                    "month_display": month_first_day.strftime("%B %Y"),
-                    "date": month_first_day.isoformat(),
+                    **_month_label_fields(month_first_day.year, month_first_day.month),
                     "portfolio_value": portfolio_value,
                     "invested_capital": invested_capital,
                     "plus_minus_values": plus_minus_values,
@@ -476,12 +547,6 @@ class PortfolioService:
                     "is_first_month": False
                 })
 
-            # Move to next month
-            if month_iter.month == 12:
-                month_iter = date(month_iter.year + 1, 1, 1)
-            else:
-                month_iter = date(month_iter.year, month_iter.month + 1, 1)
-
         # Add current value as a final row
         current_portfolio_value, current_invested_capital, current_positions = self._calculate_portfolio_value_at_date(orders, current_date)
         current_plus_minus_values = current_portfolio_value - current_invested_capital
@@ -507,28 +572,34 @@ class PortfolioService:
         orders: List[InvestmentOrder],
         target_date: date
     ) -> tuple[float, float, List[Dict[str, Any]]]:
-        """Calculate portfolio value, total invested capital and positions at a specific date."""
-        # Filter orders that occurred before the target date
-        relevant_orders = [order for order in orders if order.order_date < target_date]
+        """Calculate portfolio value, total invested capital and positions at a specific date.
+
+        orders must be sorted by order_date (callers sort them once).
+        """
+        # Orders that occurred before the target date: binary search on the sorted list
+        relevant_orders = orders[:bisect.bisect_left(orders, target_date, key=_order_date)]
 
         if not relevant_orders:
             return 0.0, 0.0, []
 
         # Group orders by ISIN and calculate quantities held at target date
         isin_positions = {}
-        for order in relevant_orders:
-            isin = order.isin
-            if isin not in isin_positions:
-                isin_positions[isin] = {
-                    'quantity': 0.0,
-                    'total_invested': 0.0
-                }
+        _accumulate_positions(isin_positions, relevant_orders)
 
-            # For now, treat all orders as buy orders (consistent with rest of codebase)
-            # TODO: Add proper buy/sell support once order_type is added to InvestmentOrder model
-            isin_positions[isin]['quantity'] += order.quantity
-            isin_positions[isin]['total_invested'] += order.total_price_eur
+        return self._value_positions(isin_positions, target_date)
 
+    def _value_positions(
+        self,
+        isin_positions: Dict[str, Dict[str, float]],
+        target_date: date,
+        batch_prices: Optional[Dict[str, float]] = None
+    ) -> tuple[float, float, List[Dict[str, Any]]]:
+        """Value positions ({isin: {'quantity', 'total_invested'}}) held at target_date.
+
+        Returns portfolio value, total invested capital and positions detail.
+        batch_prices maps each ISIN to its batch cache price already looked up for
+        target_date (NaN when missing); when omitted prices are looked up here.
+        """
         # Remove positions with zero or negative quantities
         isin_positions = {k: v for k, v in isin_positions.items() if v['quantity'] > 0}
 
@@ -541,7 +612,10 @@ class PortfolioService:
             quantity = position_data['quantity']
 
             # OPTIMISATION: Essayer d'abord le batch cache (ultra rapide)
-            price = self.price_service.get_historical_price_from_batch(isin, target_date)
+            if batch_prices is None:
+                price = self.price_service.get_historical_price_from_batch(isin, target_date)
+            else:
+                price = batch_prices[isin]
 
             # Always add the invested capital for this position, regardless of price availability
             total_invested_capital += position_data['total_invested']
@@ -638,38 +712,36 @@ class PortfolioService:
         start_date = orders[0].order_date
         current_date = date.today()
 
-        # Start from the beginning of the first month
-        month_iter = date(start_date.year, start_date.month, 1)
-        monthly_values = []
-
-        while month_iter <= current_date:
-            # Skip months before any orders exist
-            month_first_day = month_iter
+        # Month starts from the first order's month up to today,
+        # skipping months before any orders exist
+        month_starts = [
+            month_first_day
+            for month_first_day in _month_starts(start_date, current_date)
+            if month_first_day >= start_date
+        ]
 
-            if month_first_day >= start_date:
-                # Calculate position value at the beginning of this month
-                position_value, invested_capital = self._calculate_position_value_at_date(orders, isin, month_first_day)
+        # OPTIMISATION: prix batch de tous les mois en une seule recherche vectorisée
+        batch_prices = self.price_service.get_price_matrix_from_batch([isin], month_starts)[0].tolist()
 
-                # Calculate +/- values (profit/loss)
-                plus_minus_values = position_value - invested_capital
-                plus_minus_values_pct = (plus_minus_values / invested_capital * 100) if invested_capital > 0 else 0
+        monthly_values = []
+        for month_first_day, batch_price in zip(month_starts, batch_prices):
+            # Calculate position value at the beginning of this month
+            position_value, invested_capital = self._calculate_position_value_at_date(
+                orders, isin, month_first_day, batch_price
+            )
 
-                monthly_values.append({
-                    "month": month_first_day.strftime("%Y-%m"),
-                    "month_display": month_first_day.strftime("%B %Y"),
-                    "date": month_first_day.isoformat(),
-                    "position_value": position_value,
-                    "invested_capital": invested_capital,
-                    "plus_minus_values": plus_minus_values,
-                    "plus_minus_values_pct": plus_minus_values_pct,
-                    "isin": isin
-                })
+            # Calculate +/- values (profit/loss)
+            plus_minus_values = position_value - invested_capital
+            plus_minus_values_pct = (plus_minus_values / invested_capital * 100) if invested_capital > 0 else 0
 
-            # Move to next month
-            if month_iter.month == 12:
-                month_iter = date(month_iter.year + 1, 1, 1)
-            else:
-                month_iter = date(month_iter.year, month_iter.month + 1, 1)
+            monthly_values.append({
+                **_month_label_fields(month_first_day.year, month_first_day.month),
+                "position_value": position_value,
+                "invested_capital": invested_capital,
+                "plus_minus_values": plus_minus_values,
+                "plus_minus_values_pct": plus_minus_values_pct,
+                "isin": isin
+            })
 
         # Add current value as a final row
         current_position_value, current_invested_capital = self._calculate_position_value_at_date(orders, isin, current_date)
@@ -694,11 +766,20 @@ class PortfolioService:
         self,
         orders: List[InvestmentOrder],
         isin: str,
-        target_date: date
+        target_date: date,
+        batch_price: Optional[float] = None
     ) -> tuple[float, float]:
-        """Calculate position value and total invested capital for a specific ISIN at a specific date."""
+        """Calculate position value and total invested capital for a specific ISIN at a specific date.
+
+        orders must be sorted by order_date (callers sort them once).
+
+        batch_price is the batch cache price already looked up for target_date
+        (NaN when missing); when omitted it is looked up here.
+        """
         # Filter orders for this ISIN that occurred before the target date
-        relevant_orders = [order for order in orders if order.isin == isin and order.order_date < target_date]
+        # (orders are sorted by date: binary search the cutoff, then filter by ISIN)
+        cutoff = bisect.bisect_left(orders, target_date, key=_order_date)
+        relevant_orders = [order for order in orders[:cutoff] if order.isin == isin]
 
         if not relevant_orders:
             return 0.0, 0.0
@@ -717,7 +798,10 @@ class PortfolioService:
             return 0.0, 0.0
 
         # OPTIMISATION: Essayer d'abord le batch cache
-        price = self.price_service.get_historical_price_from_batch(isin, target_date)
+        if batch_price is None:
+            price = self.price_service.get_historical_price_from_batch(isin, target_date)
+        else:
+            price = batch_price
 
         if price and price > 0:
             position_value = total_quantity * price
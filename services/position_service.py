@@ -3,16 +3,96 @@ Position Service - Enriched position data retrieval.
 Extracts and consolidates data from multiple sources (Yahoo Finance, JustETF, Firebase).
 """
 
+import functools
+import json
 import logging
+import os
+import threading
+import time
+import zipfile
 from datetime import datetime
-from typing import Dict, Any, List, Optional, Callable
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable, Tuple
 
+import numpy as np
 import yfinance as yf
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional, stdlib json accepts bytes too
+    _json_loads = json.loads
 
 
 logger = logging.getLogger(__name__)
 
+JUSTETF_QUOTE_URL = "https://www.justetf.com/api/etfs/{isin}/quote"
+
+# On-disk cache of 1y daily closes, valid until the listing's next close
+YAHOO_HISTORY_CACHE_DIR = Path(os.environ.get(
+    'YAHOO_HISTORY_CACHE_DIR',
+    Path.home() / '.suivi-finance' / 'cache' / 'yahoo_hist'
+))
+
+# Constant part of the response returned when enrichment fails
+_ERROR_TEMPLATE: Dict[str, Dict[str, Any]] = {
+    'basic_quote': {
+        'price': 0.0,
+        'source': 'Error',
+        'is_valid': False,
+        'currency': 'EUR'
+    },
+    'yahoo_finance': {},
+    'justetf': {},
+    'portfolio': {'has_position': False}
+}
+
+# Fields read from the JustETF quote payload: output key -> path in the payload
+JUSTETF_QUOTE_FIELDS = (
+    ('latest_quote', ('latestQuote', 'raw')),
+    ('previous_quote', ('previousQuote', 'raw')),
+    ('daily_change_pct', ('dtdPrc', 'raw')),
+    ('daily_change_abs', ('dtdAmt', 'raw')),
+    ('trading_venue', ('quoteTradingVenue',)),
+    ('week_52_low', ('quoteLowHigh', 'low', 'raw')),
+    ('week_52_high', ('quoteLowHigh', 'high', 'raw')),
+)
+
+# Shared keep-alive session: avoids a TCP + TLS handshake per JustETF call
+_JUSTETF_SESSION = requests.Session()
+_JUSTETF_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.2,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET']
+    )
+))
+_JUSTETF_SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15',
+    'Accept': 'application/json'
+})
+
+
+def _dig(data: Any, path: Tuple[str, ...]) -> Any:
+    """Follow a key path in nested dicts, returning None on any missing level."""
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_iso(date_str: str) -> datetime:
+    """Parse an ISO date string, accepting a trailing 'Z' timezone."""
+    return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+
 
 class PositionService:
     """Service for retrieving enriched position data."""
@@ -34,8 +114,15 @@ class PositionService:
         self.price_service = price_service
         self.firebase_service = firebase_service
         self.debug_log = debug_logger or (lambda msg, data=None: None)
+        # Call sites skip building the log payload when nobody listens
+        self._debug_enabled = debug_logger is not None
 
-    def get_enriched_position_data(self, isin: str, user_id: str) -> Dict[str, Any]:
+    def get_enriched_position_data(
+        self,
+        isin: str,
+        user_id: str,
+        now_iso: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Get enriched data for a specific position.
 
@@ -48,10 +135,14 @@ class PositionService:
         Args:
             isin: The ISIN of the position
             user_id: The authenticated user's ID
+            now_iso: Timestamp to report as last_updated (defaults to now)
 
         Returns:
             Dict containing enriched position data
         """
+        if now_iso is None:
+            now_iso = datetime.now().isoformat()
+
         try:
             # Get basic price quote
             current_price_quote = self.price_service.get_current_price(isin)
@@ -75,15 +166,16 @@ class PositionService:
                 'yahoo_finance': yahoo_info,
                 'justetf': justetf_data,
                 'portfolio': portfolio_info,
-                'last_updated': datetime.now().isoformat()
+                'last_updated': now_iso
             }
 
         except Exception as e:
-            self.debug_log("Error getting enriched position data", {
-                "isin": isin,
-                "error": str(e)
-            })
-            return self._get_error_response(isin, str(e))
+            if self._debug_enabled:
+                self.debug_log("Error getting enriched position data", {
+                    "isin": isin,
+                    "error": str(e)
+                })
+            return self._get_error_response(isin, str(e), now_iso)
 
     def _fetch_yahoo_data(self, isin: str) -> Dict[str, Any]:
         """Fetch data from Yahoo Finance."""
@@ -111,64 +203,133 @@ class PositionService:
             }
 
             # Calculate technical indicators from historical data
-            hist_1y = ticker.history(period='1y')
-            if not hist_1y.empty:
-                current_price = hist_1y['Close'].iloc[-1]
-                sma_50 = (
-                    hist_1y['Close'].rolling(50).mean().iloc[-1]
-                    if len(hist_1y) > 50 else None
-                )
-                sma_200 = (
-                    hist_1y['Close'].rolling(200).mean().iloc[-1]
-                    if len(hist_1y) > 200 else None
+            closes = self._load_cached_history(isin)
+            if closes is None:
+                # Only Close is read: skip dividends/splits and the adjustment pass.
+                # Keep a 1y window, shorter periods can return fewer than 200 sessions.
+                hist_1y = ticker.history(
+                    period='1y', interval='1d',
+                    actions=False, auto_adjust=False, prepost=False, repair=False
                 )
+                closes = hist_1y['Close'].to_numpy() if not hist_1y.empty else None
+                if closes is not None and closes.size:
+                    valid_until = self._history_valid_until(ticker)
+                    if valid_until is not None:
+                        self._save_cached_history(isin, closes, valid_until)
 
-                yahoo_info.update({
-                    'sma_50': float(sma_50) if sma_50 is not None else None,
-                    'sma_200': float(sma_200) if sma_200 is not None else None,
-                    'current_price_yahoo': float(current_price)
-                })
+            yahoo_info.update(self._compute_indicators(closes))
 
         except Exception as e:
-            self.debug_log("Error fetching Yahoo data", {
-                "isin": isin,
-                "error": str(e)
-            })
+            if self._debug_enabled:
+                self.debug_log("Error fetching Yahoo data", {
+                    "isin": isin,
+                    "error": str(e)
+                })
 
         return yahoo_info
 
+    @staticmethod
+    def _history_cache_path(isin: str) -> Optional[Path]:
+        """Return the cache file of an ISIN, or None if it is not a safe file name."""
+        if not isin.isalnum():
+            return None
+        return YAHOO_HISTORY_CACHE_DIR / f'{isin}.npz'
+
+    @staticmethod
+    def _history_valid_until(ticker) -> Optional[float]:
+        """
+        Return when freshly downloaded closes go stale, or None to skip caching.
+
+        Relies on the listing's own regular session from the history metadata.
+        While that session is open the last bar is partial, so nothing is cached.
+        """
+        try:
+            period = ticker.history_metadata['currentTradingPeriod']['regular']
+            start, end = float(period['start']), float(period['end'])
+        except Exception:
+            return None
+
+        now = time.time()
+        if start <= now < end:
+            return None
+        if now < start:
+            return end
+        # After the close, the next session ends a day later at the earliest
+        return max(end + 86400, now + 3600)
+
+    def _load_cached_history(self, isin: str) -> Optional[np.ndarray]:
+        """Load daily closes from disk if the listing has not closed again since."""
+        path = self._history_cache_path(isin)
+        if path is None:
+            return None
+
+        try:
+            with np.load(path) as cached:
+                if float(cached['valid_until']) <= time.time():
+                    return None
+                return cached['closes']
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+    def _save_cached_history(self, isin: str, closes: np.ndarray, valid_until: float) -> None:
+        """Persist daily closes to disk, atomically replacing any previous file."""
+        path = self._history_cache_path(isin)
+        if path is None:
+            return
+
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, closes=closes, valid_until=np.float64(valid_until))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if self._debug_enabled:
+                self.debug_log("Error writing Yahoo history cache", {
+                    "isin": isin,
+                    "error": str(e)
+                })
+
+    @staticmethod
+    def _compute_indicators(closes: Optional[np.ndarray]) -> Dict[str, Any]:
+        """Compute SMA-50/200 and the last close from daily closes."""
+        if closes is None or not closes.size:
+            return {}
+
+        # Only the last value of each SMA is needed: average the tail slice
+        return {
+            'sma_50': float(closes[-50:].mean()) if closes.size > 50 else None,
+            'sma_200': float(closes[-200:].mean()) if closes.size > 200 else None,
+            'current_price_yahoo': float(closes[-1])
+        }
+
     def _fetch_justetf_data(self, isin: str) -> Dict[str, Any]:
         """Fetch data from JustETF."""
         justetf_data = {}
 
         try:
             headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15',
-                'Accept': 'application/json',
                 'Referer': f'https://www.justetf.com/fr/etf-profile.html?isin={isin}'
             }
 
-            url = f"https://www.justetf.com/api/etfs/{isin}/quote"
+            url = JUSTETF_QUOTE_URL.format(isin=isin)
             params = {'currency': 'EUR', 'locale': 'fr'}
-            response = requests.get(url, params=params, headers=headers, timeout=8)
-
-            if response.status_code == 200:
-                data = response.json()
-                justetf_data = {
-                    'latest_quote': data.get('latestQuote', {}).get('raw'),
-                    'previous_quote': data.get('previousQuote', {}).get('raw'),
-                    'daily_change_pct': data.get('dtdPrc', {}).get('raw'),
-                    'daily_change_abs': data.get('dtdAmt', {}).get('raw'),
-                    'trading_venue': data.get('quoteTradingVenue'),
-                    'week_52_low': data.get('quoteLowHigh', {}).get('low', {}).get('raw'),
-                    'week_52_high': data.get('quoteLowHigh', {}).get('high', {}).get('raw')
-                }
+            # Closing the response hands the connection back to the pool right away
+            with _JUSTETF_SESSION.get(
+                url, params=params, headers=headers, timeout=8
+            ) as response:
+                if response.status_code == 200:
+                    data = _json_loads(response.content)
+                    justetf_data = {
+                        key: _dig(data, path) for key, path in JUSTETF_QUOTE_FIELDS
+                    }
 
         except Exception as e:
-            self.debug_log("Error fetching JustETF data", {
-                "isin": isin,
-                "error": str(e)
-            })
+            if self._debug_enabled:
+                self.debug_log("Error fetching JustETF data", {
+                    "isin": isin,
+                    "error": str(e)
+                })
 
         return justetf_data
 
@@ -182,7 +343,8 @@ class PositionService:
         portfolio_info = {'has_position': False}
 
         try:
-            # Load user's orders from Firebase
+            # Read on every call: orders change from any worker process, and a
+            # failed read (empty list) must not outlive this request
             user_orders = self.firebase_service.get_user_orders(user_id)
 
             # Filter orders for this ISIN
@@ -239,28 +401,28 @@ class PositionService:
                 portfolio_info['unrealized_pnl_pct'] = 0
 
         except Exception as e:
-            self.debug_log("Error fetching portfolio data", {
-                "isin": isin,
-                "user_id": user_id,
-                "error": str(e)
-            })
+            if self._debug_enabled:
+                self.debug_log("Error fetching portfolio data", {
+                    "isin": isin,
+                    "user_id": user_id,
+                    "error": str(e)
+                })
             portfolio_info = {'has_position': False}
 
         return portfolio_info
 
     def _parse_order_dates(self, orders: List[Dict]) -> List[datetime]:
-        """Parse order dates from various formats."""
+        """Parse the distinct order dates from various formats."""
         dates = []
-        for order in orders:
-            date_str = order.get('date')
+        # Orders often share a trade date: parse each distinct value once
+        for date_str in dict.fromkeys(order.get('date') for order in orders):
             if not date_str:
                 continue
 
             try:
                 if isinstance(date_str, str):
                     # Handle ISO format with timezone
-                    date_str = date_str.replace('Z', '+00:00')
-                    dates.append(datetime.fromisoformat(date_str))
+                    dates.append(_parse_iso(date_str))
                 else:
                     dates.append(date_str)
             except (ValueError, TypeError):
@@ -268,19 +430,9 @@ class PositionService:
 
         return dates
 
-    def _get_error_response(self, isin: str, error: str) -> Dict[str, Any]:
+    def _get_error_response(self, isin: str, error: str, now_iso: str) -> Dict[str, Any]:
         """Return a standardized error response."""
-        return {
-            'isin': isin,
-            'error': error,
-            'basic_quote': {
-                'price': 0.0,
-                'source': 'Error',
-                'is_valid': False,
-                'currency': 'EUR'
-            },
-            'yahoo_finance': {},
-            'justetf': {},
-            'portfolio': {'has_position': False},
-            'last_updated': datetime.now().isoformat()
-        }
+        response = {'isin': isin, 'error': error, 'last_updated': now_iso}
+        # Nested dicts are copied so callers can't alter the shared template
+        response.update({key: value.copy() for key, value in _ERROR_TEMPLATE.items()})
+        return response
@@ -3,14 +3,95 @@ Service for fetching financial prices from external APIs.
 Handles both Yahoo Finance and JustETF data sources.
 """
 
+import functools
+import json
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+
+import numpy as np
 import requests
 import yfinance as yf
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta, date
-from typing import Optional, Tuple, Dict, Any, List
+from typing import Optional, Tuple, Dict, Any, List, Mapping
 import concurrent.futures
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson est optionnel, json accepte aussi des bytes
+    _json_loads = json.loads
+
 from models import PriceQuote
+from services.file_cache import FileCache
+
+# Cache disque des historiques de prix (survit aux redémarrages)
+PRICE_CACHE_DIR = Path(os.environ.get(
+    "PRICE_CACHE_DIR",
+    Path.home() / ".suivi-finance" / "cache" / "prices"
+))
+
+
+# Devises cotées en centièmes (ex. pence) : devise ISO et facteur de conversion
+_MINOR_CURRENCY_UNITS = {
+    "GBp": ("GBP", 0.01),
+    "GBX": ("GBP", 0.01),
+    "ZAc": ("ZAR", 0.01),
+    "ILA": ("ILS", 0.01),
+}
+
+_ISIN_DIGITS = b"0123456789"
+_ISIN_LETTERS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_ISIN_ALNUM = _ISIN_LETTERS + _ISIN_DIGITS
+
+
+@functools.lru_cache(maxsize=1024)
+def _is_isin_code(clean_identifier: str) -> bool:
+    """
+    Check an already stripped/uppercased identifier against the ISIN layout
+    (2 letters, 9 alphanumerics, 1 digit) without going through the regex engine.
+    """
+    try:
+        raw = clean_identifier.encode("ascii")
+    except UnicodeEncodeError:
+        return False
+    if len(raw) != 12:
+        return False
+    # translate(None, allowed) deletes allowed bytes: empty result means all valid
+    return (
+        not raw[:2].translate(None, _ISIN_LETTERS)
+        and not raw[2:11].translate(None, _ISIN_ALNUM)
+        and not raw[11:].translate(None, _ISIN_DIGITS)
+    )
+
+
+@functools.lru_cache(maxsize=512)
+def _justetf_referer_headers(isin: str) -> MappingProxyType:
+    """Read-only per-ISIN JustETF headers, built once per ISIN."""
+    return MappingProxyType({
+        "Referer": f"https://www.justetf.com/fr/etf-profile.html?isin={isin}",
+    })
+
+
+# Erreurs attendues d'un appel Yahoo : réseau/HTTP ou réponse JSON inattendue
+_YAHOO_ERRORS = (requests.RequestException, LookupError, TypeError, ValueError)
+
+
+@dataclass(slots=True)
+class CachedSeries:
+    """Historique batch d'un ISIN : dates triées et prix EUR alignés."""
+    dates: np.ndarray  # datetime64[D]
+    prices: np.ndarray  # float64
+
+    def __len__(self) -> int:
+        return int(self.dates.size)
 
 
 class PriceService:
@@ -18,11 +99,120 @@ class PriceService:
 
     ISIN_PATTERN = re.compile(r"^[A-Z]{2}[A-Z0-9]{9}\d$")
     JUSTETF_BASE_URL = "https://www.justetf.com/api/etfs"
+    # ISIN-independent headers, set once on the HTTP session
+    JUSTETF_HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15",
+        "Accept": "application/json, text/plain, */*",
+        "Accept-Language": "fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7",
+        "Origin": "https://www.justetf.com",
+        "Connection": "keep-alive",
+    }
+    # Enough pooled connections for the batch thread pool
+    HTTP_POOL_SIZE = 16
+    YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+    YAHOO_SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
+    # Same lower bound yfinance uses for period='max'
+    YAHOO_MAX_PERIOD_START = -2208994789
+    # Closed history windows never change; windows touching the last days do
+    HISTORY_CACHE_TTL_SECONDS = 90 * 24 * 3600
+    RECENT_CACHE_TTL_SECONDS = 3600
+    RECENT_DAYS = 2
+    # FX rates barely move at the scale of a portfolio valuation: spot rates
+    # used for current prices are reused for 5 minutes, daily FX histories
+    # used to convert batch series for an hour
+    FX_SPOT_TTL_SECONDS = 300
+    FX_HISTORY_TTL_SECONDS = 3600
+    # yf.Ticker memoizes its own quote data: keep instances only briefly,
+    # and at most YF_TICKER_CACHE_MAX of them (LRU beyond that)
+    YF_TICKER_TTL_SECONDS = 300
+    YF_TICKER_CACHE_MAX = 256
+    # Séries batch gardées en mémoire (~40 Ko par ISIN sur 20 ans), LRU au-delà
+    BATCH_CACHE_MAX_ISINS = 512
 
     def __init__(self, debug_logger=None):
         self.logger = debug_logger
-        self._batch_cache = {}  # Cache pour le batch pricing: {isin: {date: price}}
+        # Cache pour le batch pricing: {isin: CachedSeries}, le moins récemment utilisé en premier
+        self._batch_cache: 'OrderedDict[str, CachedSeries]' = OrderedDict()
+
+        # Keep-alive session: one TCP + TLS handshake per host instead of per call
+        self._session = requests.Session()
+        self._session.headers.update(self.JUSTETF_HEADERS)
+        self._session.mount("https://", HTTPAdapter(
+            pool_connections=self.HTTP_POOL_SIZE,
+            pool_maxsize=self.HTTP_POOL_SIZE * 2
+        ))
+
+        # Separate session for Yahoo so JustETF Origin/Referer headers never leak there
+        self._yahoo_session = requests.Session()
+        self._yahoo_session.headers.update({"User-Agent": self.JUSTETF_HEADERS["User-Agent"]})
+        self._yahoo_session.mount("https://", HTTPAdapter(
+            pool_connections=self.HTTP_POOL_SIZE,
+            pool_maxsize=self.HTTP_POOL_SIZE * 2,
+            # Yahoo limite les rafales (429) : on réessaie avec backoff plutôt que
+            # de retomber sur le téléchargement yfinance complet
+            max_retries=Retry(
+                total=2,
+                backoff_factor=0.2,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET"]
+            )
+        ))
+        self._yahoo_symbols: Dict[str, Optional[str]] = {}  # {isin: symbole Yahoo}
+        # {symbol: (yf.Ticker, verrou, created_at)}, le moins récemment utilisé en premier
+        self._yf_tickers: 'OrderedDict[str, Tuple[Any, threading.Lock, float]]' = OrderedDict()
+        self._file_cache = FileCache(PRICE_CACHE_DIR)
+
+        # Shared by the batch worker threads
+        self._cache_lock = threading.Lock()
+        self._currency_cache: Dict[str, str] = {}  # {ticker: currency}
+        self._fx_cache: Dict[str, Tuple[float, float]] = {}  # {currency: (rate, fetched_at)}
+        # {currency: ((dates, rates), fetched_at)} pour convertir les séries batch
+        self._fx_history_cache: Dict[str, Tuple[Tuple[np.ndarray, np.ndarray], float]] = {}
+        self._fx_fetch_locks: Dict[str, threading.Lock] = {}  # un verrou par devise
+
+    def close(self):
+        """Release the pooled HTTP connections."""
+        self._session.close()
+        self._yahoo_session.close()
     
+    def _get_yf_ticker(self, symbol: str) -> Tuple[Any, threading.Lock]:
+        """
+        Return a shared yf.Ticker for the symbol and the lock guarding it.
+
+        Building a Ticker from an ISIN triggers a symbol search, and each
+        instance sets up its own data fetcher: reuse them across calls, rebuilt
+        every YF_TICKER_TTL_SECONDS. A Ticker keeps per-instance state
+        (history_metadata, lazily loaded info), so callers hold the returned
+        lock while they use it from the batch worker threads.
+        """
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._yf_tickers.get(symbol)
+            if cached and now - cached[2] < self.YF_TICKER_TTL_SECONDS:
+                self._yf_tickers.move_to_end(symbol)
+                return cached[0], cached[1]
+
+        yf_ticker = yf.Ticker(symbol)
+        with self._cache_lock:
+            cached = self._yf_tickers.get(symbol)
+            if cached and now - cached[2] < self.YF_TICKER_TTL_SECONDS:
+                # Another thread built it meanwhile: share that instance
+                self._yf_tickers.move_to_end(symbol)
+                return cached[0], cached[1]
+            entry = (yf_ticker, threading.Lock(), now)
+            self._yf_tickers[symbol] = entry
+            self._yf_tickers.move_to_end(symbol)
+            # Expired instances first, then the least recently used ones
+            expired = [
+                key for key, (_, _, created_at) in self._yf_tickers.items()
+                if now - created_at >= self.YF_TICKER_TTL_SECONDS
+            ]
+            for key in expired:
+                del self._yf_tickers[key]
+            while len(self._yf_tickers) > self.YF_TICKER_CACHE_MAX:
+                self._yf_tickers.popitem(last=False)
+        return entry[0], entry[1]
+
     def _log(self, message: str, extra: Optional[Dict[str, Any]] = None):
         """Log debug information if logger is available."""
         if self.logger:
@@ -32,8 +222,7 @@ class PriceService:
         """Check if the given string is a valid ISIN code."""
         if not identifier:
             return False
-        clean_identifier = identifier.strip().upper()
-        return bool(self.ISIN_PATTERN.match(clean_identifier))
+        return _is_isin_code(identifier.strip().upper())
     
     def get_current_price(self, ticker_or_isin: str) -> PriceQuote:
         """
@@ -49,15 +238,15 @@ class PriceService:
         
         self._log("Fetching current price", {"ticker": ticker_or_isin})
         
-        # Try Yahoo Finance first for ticker symbols
-        if not self.is_valid_isin(ticker_or_isin):
+        clean = ticker_or_isin.strip().upper()
+        
+        # Try Yahoo Finance for ticker symbols, JustETF for ISIN codes
+        if not _is_isin_code(clean):
             yahoo_quote = self._get_yahoo_current_price(ticker_or_isin)
             if yahoo_quote.is_valid:
                 return yahoo_quote
-        
-        # Try JustETF for ISIN codes or as fallback
-        if self.is_valid_isin(ticker_or_isin):
-            justetf_quote = self._get_justetf_current_price(ticker_or_isin)
+        else:
+            justetf_quote = self._get_justetf_current_price(clean)
             if justetf_quote.is_valid:
                 return justetf_quote
         
@@ -85,8 +274,9 @@ class PriceService:
         })
         
         # Use JustETF for ISIN codes
-        if self.is_valid_isin(ticker_or_isin):
-            return self._get_justetf_historical_price(ticker_or_isin, target_date)
+        clean = ticker_or_isin.strip().upper()
+        if _is_isin_code(clean):
+            return self._get_justetf_historical_price(clean, target_date)
         
         # Use Yahoo Finance for ticker symbols
         return self._get_yahoo_historical_price(ticker_or_isin, target_date)
@@ -94,18 +284,21 @@ class PriceService:
     def _get_yahoo_current_price(self, ticker: str) -> PriceQuote:
         """Get current price from Yahoo Finance."""
         try:
-            yf_ticker = yf.Ticker(ticker)
-            
-            # Try fast_info first (more reliable in newer versions)
-            price = self._extract_yahoo_fast_price(yf_ticker)
-            
-            # Fallback to info
-            if price is None:
-                price = self._extract_yahoo_info_price(yf_ticker)
-            
-            # Final fallback to recent history
-            if price is None:
-                price = self._extract_yahoo_history_price(yf_ticker)
+            yf_ticker, yf_lock = self._get_yf_ticker(ticker)
+            with yf_lock:
+                # Try fast_info first (more reliable in newer versions)
+                price, currency = self._extract_yahoo_fast_price(yf_ticker)
+                
+                # Fallback to info
+                if price is None:
+                    price, currency = self._extract_yahoo_info_price(yf_ticker)
+                
+                # Final fallback to recent history
+                if price is None:
+                    price = self._extract_yahoo_history_price(yf_ticker)
+                
+                if price is not None:
+                    currency = self._resolve_currency(ticker, yf_ticker, currency)
             
             if price is None:
                 return PriceQuote(
@@ -115,7 +308,6 @@ class PriceService:
                 )
             
             # Convert to EUR if needed
-            currency = self._get_yahoo_currency(yf_ticker)
             if currency and currency.upper() != "EUR":
                 eur_price = self._convert_to_eur(price, currency)
                 if eur_price is not None:
@@ -139,41 +331,61 @@ class PriceService:
                 error_message=f"Yahoo Finance error: {str(e)}"
             )
     
-    def _extract_yahoo_fast_price(self, yf_ticker) -> Optional[float]:
-        """Extract price from Yahoo Finance fast_info."""
+    def _extract_yahoo_fast_price(self, yf_ticker) -> Tuple[Optional[float], Optional[str]]:
+        """Extract price and currency from Yahoo Finance fast_info in one pass."""
         try:
             fast_info = getattr(yf_ticker, "fast_info", None)
             if not fast_info:
-                return None
+                return None, None
             
             for key in ("lastPrice", "regularMarketPrice", "last_price", "last_trade_price"):
                 if key in fast_info and fast_info[key] is not None:
-                    return float(fast_info[key])
+                    currency = fast_info["currency"] if "currency" in fast_info else None
+                    return float(fast_info[key]), (str(currency).upper() if currency else None)
         except Exception:
             pass
-        return None
+        return None, None
     
-    def _extract_yahoo_info_price(self, yf_ticker) -> Optional[float]:
-        """Extract price from Yahoo Finance info."""
+    def _extract_yahoo_info_price(self, yf_ticker) -> Tuple[Optional[float], Optional[str]]:
+        """Extract price and currency from Yahoo Finance info in one pass."""
         try:
             info = yf_ticker.info or {}
             for key in ("currentPrice", "regularMarketPrice", "regularMarketPreviousClose"):
                 if key in info and info[key] is not None:
-                    return float(info[key])
+                    currency = info.get("currency")
+                    return float(info[key]), (str(currency).upper() if currency else None)
         except Exception:
             pass
-        return None
+        return None, None
     
     def _extract_yahoo_history_price(self, yf_ticker) -> Optional[float]:
         """Extract latest price from Yahoo Finance history."""
         try:
-            hist = yf_ticker.history(period="1d", interval="1m")
+            hist = yf_ticker.history(period="1d", interval="1m", actions=False)
             if not hist.empty:
                 return float(hist["Close"].iloc[-1])
         except Exception:
             pass
         return None
     
+    def _resolve_currency(self, ticker: str, yf_ticker, currency: Optional[str] = None) -> Optional[str]:
+        """Return the ticker currency, querying Yahoo only once per ticker."""
+        if currency:
+            with self._cache_lock:
+                self._currency_cache[ticker] = currency
+            return currency
+        
+        with self._cache_lock:
+            cached = self._currency_cache.get(ticker)
+        if cached:
+            return cached
+        
+        currency = self._get_yahoo_currency(yf_ticker)
+        if currency:
+            with self._cache_lock:
+                self._currency_cache[ticker] = currency
+        return currency
+    
     def _get_yahoo_currency(self, yf_ticker) -> Optional[str]:
         """Get currency from Yahoo Finance ticker."""
         try:
@@ -197,43 +409,57 @@ class PriceService:
     
     def _convert_to_eur(self, amount: float, from_currency: str) -> Optional[float]:
         """Convert amount from given currency to EUR using Yahoo Finance FX rates."""
-        if from_currency.upper() == "EUR":
+        currency = from_currency.upper()
+        if currency == "EUR":
             return amount
         
+        rate = self._get_fx_rate(currency)
+        return amount * rate if rate is not None else None
+    
+    def _get_fx_rate(self, currency: str) -> Optional[float]:
+        """Get the currency -> EUR spot rate, cached for FX_SPOT_TTL_SECONDS."""
+        with self._cache_lock:
+            cached = self._fx_cache.get(currency)
+        if cached and time.time() - cached[1] < self.FX_SPOT_TTL_SECONDS:
+            return cached[0]
+        
+        rate = None
         try:
-            fx_pair = f"{from_currency.upper()}EUR=X"
-            fx_ticker = yf.Ticker(fx_pair)
-            
-            # Try fast_info first
-            try:
-                fast_info = getattr(fx_ticker, "fast_info", None)
-                if fast_info:
-                    for key in ("lastPrice", "regularMarketPrice", "last_price"):
-                        if key in fast_info and fast_info[key] is not None:
-                            rate = float(fast_info[key])
-                            return amount * rate
-            except Exception:
-                pass
-            
-            # Fallback to recent history
-            hist = fx_ticker.history(period="5d", interval="1d")
-            if not hist.empty:
-                rate = float(hist["Close"].iloc[-1])
-                return amount * rate
+            fx_ticker, fx_lock = self._get_yf_ticker(f"{currency}EUR=X")
+            with fx_lock:
+                # Try fast_info first
+                try:
+                    fast_info = getattr(fx_ticker, "fast_info", None)
+                    if fast_info:
+                        for key in ("lastPrice", "regularMarketPrice", "last_price"):
+                            if key in fast_info and fast_info[key] is not None:
+                                rate = float(fast_info[key])
+                                break
+                except Exception:
+                    pass
+                
+                # Fallback to recent history
+                if rate is None:
+                    hist = fx_ticker.history(period="5d", interval="1d", actions=False)
+                    if not hist.empty:
+                        rate = float(hist["Close"].iloc[-1])
                 
         except Exception as e:
             self._log("Currency conversion error", {
-                "from": from_currency,
+                "from": currency,
                 "to": "EUR",
                 "error": str(e)
             })
         
-        return None
+        if rate is not None:
+            with self._cache_lock:
+                self._fx_cache[currency] = (rate, time.time())
+        return rate
     
     def _get_yahoo_historical_price(self, ticker: str, target_date: date) -> PriceQuote:
         """Get historical price from Yahoo Finance."""
         try:
-            yf_ticker = yf.Ticker(ticker)
+            yf_ticker, yf_lock = self._get_yf_ticker(ticker)
             start_date = target_date - timedelta(days=10)
             end_date = target_date + timedelta(days=1)
             
@@ -243,11 +469,15 @@ class PriceService:
                 "end": end_date.isoformat()
             })
             
-            hist = yf_ticker.history(
-                start=start_date.strftime("%Y-%m-%d"),
-                end=end_date.strftime("%Y-%m-%d"),
-                interval="1d"
-            )
+            # Only the raw Close is used: skip dividend/split columns and adjustment
+            with yf_lock:
+                hist = yf_ticker.history(
+                    start=start_date.strftime("%Y-%m-%d"),
+                    end=end_date.strftime("%Y-%m-%d"),
+                    interval="1d",
+                    actions=False,
+                    auto_adjust=False
+                )
             
             if hist.empty:
                 return PriceQuote(
@@ -255,28 +485,31 @@ class PriceService:
                     source="Yahoo Finance",
                     error_message="No historical data available"
                 )
+            closes = hist["Close"]
             
-            # Find the best available date on or before target date
-            best_date = None
-            best_price = None
-            
-            hist = hist.sort_index()
-            for idx, row in hist.iterrows():
-                price_date = idx.date()
-                if price_date <= target_date:
-                    if not best_date or price_date > best_date:
-                        best_date = price_date
-                        best_price = float(row.get("Close"))
+            # Find the best available date on or before target date.
+            # Yahoo returns bars in ascending order; only sort if that ever changes.
+            if not closes.index.is_monotonic_increasing:
+                closes = closes.sort_index()
+            index = closes.index
+            if getattr(index, "tz", None) is not None:
+                index = index.tz_localize(None)
+            dates = index.values.astype("datetime64[D]")
+            best_idx = int(np.searchsorted(dates, np.datetime64(target_date, "D"), side="right")) - 1
             
-            if best_price is None:
+            if best_idx < 0:
                 return PriceQuote(
                     price=0.0,
                     source="Yahoo Finance",
                     error_message="No price data for requested date"
                 )
             
+            best_date = dates[best_idx].item()
+            best_price = float(closes.iat[best_idx])
+            
             # Convert to EUR if needed
-            currency = self._get_yahoo_currency(yf_ticker)
+            with yf_lock:
+                currency = self._resolve_currency(ticker, yf_ticker)
             if currency and currency.upper() != "EUR":
                 eur_price = self._convert_to_eur(best_price, currency)
                 if eur_price is not None:
@@ -307,21 +540,20 @@ class PriceService:
             )
     
     def _get_justetf_current_price(self, isin: str) -> PriceQuote:
-        """Get current price from JustETF."""
+        """Get current price from JustETF (isin already stripped and uppercased)."""
         try:
-            clean_isin = isin.strip().upper()
-            url = f"{self.JUSTETF_BASE_URL}/{clean_isin}/quote"
+            url = f"{self.JUSTETF_BASE_URL}/{isin}/quote"
             params = {"currency": "EUR", "locale": "fr"}
             
             self._log("JustETF quote request", {"url": url, "params": params})
             
-            headers = self._get_justetf_headers(clean_isin)
-            response = requests.get(url, params=params, headers=headers, timeout=8)
+            headers = self._get_justetf_headers(isin)
+            response = self._session.get(url, params=params, headers=headers, timeout=8)
             
             self._log("JustETF response", {"status_code": response.status_code})
             response.raise_for_status()
             
-            data = response.json()
+            data = _json_loads(response.content)
             latest_quote = data.get("latestQuote", {})
             raw_price = latest_quote.get("raw")
             
@@ -348,51 +580,66 @@ class PriceService:
                 error_message=f"JustETF error: {str(e)}"
             )
     
-    def _get_justetf_historical_price(self, isin: str, target_date: date) -> PriceQuote:
-        """Get historical price from JustETF performance chart."""
+    def _get_justetf_historical_price(
+        self,
+        isin: str,
+        target_date: date,
+        allow_current_fallback: bool = False
+    ) -> PriceQuote:
+        """
+        Get historical price from JustETF performance chart.
+
+        The performance chart is the only HTTP call: a current quote is not a
+        historical price, so it is only used when allow_current_fallback is set.
+        The isin is expected already stripped and uppercased.
+        """
         try:
-            clean_isin = isin.strip().upper()
             start_date = target_date - timedelta(days=10)
             
             historical_data = self._fetch_justetf_historical_data(
-                clean_isin,
+                isin,
                 start_date.strftime("%Y-%m-%d"),
                 target_date.strftime("%Y-%m-%d")
             )
             
             if not historical_data:
-                # Fallback to current quote
-                current_quote = self._get_justetf_current_price(isin)
-                if current_quote.is_valid:
-                    return current_quote
+                if allow_current_fallback:
+                    current_quote = self._get_justetf_current_price(isin)
+                    if current_quote.is_valid:
+                        return current_quote
                 return PriceQuote(
                     price=0.0,
                     source="JustETF",
                     error_message="No historical data available"
                 )
             
-            # Find best available date
-            series = historical_data.get("series", [])
-            best_date = None
+            # Find best available date. ISO dates order like strings, so the
+            # series is scanned without parsing every point
+            target_str = target_date.isoformat()
+            best_str = None
             best_price = None
             
-            for item in series:
-                try:
-                    item_date = datetime.strptime(item["date"], "%Y-%m-%d").date()
-                    if item_date <= target_date:
-                        if not best_date or item_date > best_date:
-                            best_date = item_date
-                            best_price = float(item["value"])
-                except Exception:
+            for item in historical_data.get("series", []):
+                item_date = item["date"]
+                # A malformed payload can carry non-string dates: skip those points
+                if not isinstance(item_date, str):
                     continue
+                item_str = item_date[:10]
+                if len(item_str) == 10 and item_str <= target_str:
+                    if best_str is None or item_str > best_str:
+                        best_str = item_str
+                        best_price = item["value"]
             
             if best_price is not None:
-                return PriceQuote(
-                    price=best_price,
-                    source="JustETF",
-                    quote_date=best_date,
-                    currency="EUR"
-                )
+                try:
+                    return PriceQuote(
+                        price=float(best_price),
+                        source="JustETF",
+                        quote_date=date.fromisoformat(best_str),
+                        currency="EUR"
+                    )
+                except ValueError:
+                    pass
             
             # Fallback to latest quote if no historical match
             latest_value = historical_data.get("latestQuote")
@@ -400,7 +647,7 @@ class PriceService:
             
             if latest_value is not None and latest_date:
                 try:
-                    latest_d = datetime.strptime(latest_date[:10], "%Y-%m-%d").date()
+                    latest_d = date.fromisoformat(latest_date[:10])
                     if latest_d <= target_date:
                         return PriceQuote(
                             price=float(latest_value),
@@ -429,13 +676,46 @@ class PriceService:
                 error_message=f"JustETF historical error: {str(e)}"
             )
     
+    def _history_cache_ttl(self, date_to: date) -> int:
+        """TTL of a cached history: long once the window no longer covers recent days."""
+        if date_to <= date.today() - timedelta(days=self.RECENT_DAYS):
+            return self.HISTORY_CACHE_TTL_SECONDS
+        return self.RECENT_CACHE_TTL_SECONDS
+
     def _fetch_justetf_historical_data(
         self,
         isin: str,
         date_from: str,
         date_to: str
     ) -> Optional[Dict[str, Any]]:
-        """Fetch historical data from JustETF performance chart endpoint."""
+        """
+        Fetch historical data from JustETF performance chart endpoint.
+
+        Responses are kept in the file cache; latestQuote reflects the time of
+        the original request.
+        """
+        cache_params = {"dateFrom": date_from, "dateTo": date_to}
+        try:
+            ttl = self._history_cache_ttl(date.fromisoformat(date_to[:10]))
+        except ValueError:
+            ttl = self.RECENT_CACHE_TTL_SECONDS
+
+        cached = self._file_cache.get(isin, "performance-chart", cache_params, ttl)
+        if cached is not None:
+            return cached
+
+        result = self._request_justetf_historical_data(isin, date_from, date_to)
+        if result is not None:
+            self._file_cache.set(isin, "performance-chart", cache_params, result)
+        return result
+
+    def _request_justetf_historical_data(
+        self,
+        isin: str,
+        date_from: str,
+        date_to: str
+    ) -> Optional[Dict[str, Any]]:
+        """Request historical data from the JustETF performance chart endpoint."""
         try:
             url = f"{self.JUSTETF_BASE_URL}/{isin}/performance-chart"
             params = {
@@ -450,29 +730,21 @@ class PriceService:
             }
             
             headers = self._get_justetf_headers(isin)
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = self._session.get(url, params=params, headers=headers, timeout=10)
             
             self._log("JustETF performance chart request", {"url": url, "params": params})
             self._log("JustETF response", {"status_code": response.status_code})
             
             response.raise_for_status()
-            data = response.json()
-            
-            # Normalize series data
-            normalized_series = []
-            for item in data.get("series", []) or []:
-                date_str = item.get("date")
-                value_obj = item.get("value", {}) or {}
-                raw_value = value_obj.get("raw")
-                
-                if date_str is not None and raw_value is not None:
-                    try:
-                        normalized_series.append({
-                            "date": date_str,
-                            "value": float(raw_value)
-                        })
-                    except Exception:
-                        continue
+            data = _json_loads(response.content)
+            
+            # Normalize series data (points without a numeric value are skipped)
+            normalized_series = [
+                {"date": item["date"], "value": float(raw_value)}
+                for item in data.get("series") or []
+                if item.get("date") is not None
+                and isinstance(raw_value := (item.get("value") or {}).get("raw"), (int, float))
+            ]
             
             latest_quote = data.get("latestQuote", {}) or {}
             latest_raw = latest_quote.get("raw")
@@ -496,112 +768,433 @@ class PriceService:
             self._log("JustETF performance error", {"isin": isin, "error": str(e)})
             return None
     
-    def _get_justetf_headers(self, isin: str) -> Dict[str, str]:
-        """Get standard headers for JustETF API requests."""
-        return {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15",
-            "Accept": "application/json, text/plain, */*",
-            "Accept-Language": "fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7",
-            "Origin": "https://www.justetf.com",
-            "Referer": f"https://www.justetf.com/fr/etf-profile.html?isin={isin}",
-            "Connection": "keep-alive",
-        }
+    def _get_justetf_headers(self, isin: str) -> Mapping[str, str]:
+        """Get the per-ISIN headers for JustETF API requests (the rest are on the session)."""
+        return _justetf_referer_headers(isin)
 
     # ============================================================================
     # BATCH PRICING - Optimisation pour récupérer tous les prix en une fois
     # ============================================================================
 
-    def fetch_batch_historical_prices(self, isins: List[str], max_workers: int = 5) -> Dict[str, Dict[date, float]]:
+    def fetch_batch_historical_prices(
+        self,
+        isins: List[str],
+        max_workers: int = 5
+    ) -> Dict[str, CachedSeries]:
         """
         Fetch tous les prix historiques pour une liste d'ISINs EN PARALLÈLE.
 
-        Retourne: {isin: {date: price}}
+        Retourne: {isin: CachedSeries} — dates triées et prix alignés
 
         Cette méthode est ~50x plus rapide que des appels individuels à get_historical_price().
         """
-        self._log("Batch fetch starting", {"isins_count": len(isins), "max_workers": max_workers})
+        isins = list(dict.fromkeys(isins))
+        workers = min(max_workers, len(isins))
+        self._log("Batch fetch starting", {"isins_count": len(isins), "max_workers": workers})
 
         results = {}
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Soumettre toutes les tâches en parallèle
-            futures = {executor.submit(self._fetch_all_prices_for_isin, isin): isin for isin in isins}
-
-            # Récupérer les résultats au fur et à mesure
-            for future in concurrent.futures.as_completed(futures):
-                isin = futures[future]
-                try:
-                    prices = future.result()
-                    results[isin] = prices
-
-                    # Mettre à jour le cache
-                    self._batch_cache[isin] = prices
+        if workers <= 1:
+            # Un seul ISIN : inutile de créer un pool de threads
+            for isin in isins:
+                self._store_batch_result(results, isin, self._fetch_all_prices_for_isin, isin)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                # Soumettre toutes les tâches en parallèle
+                futures = {executor.submit(self._fetch_all_prices_for_isin, isin): isin for isin in isins}
 
-                    self._log("Batch fetch completed for ISIN", {
-                        "isin": isin,
-                        "days_fetched": len(prices)
-                    })
-                except Exception as e:
-                    self._log("Batch fetch failed for ISIN", {"isin": isin, "error": str(e)})
-                    results[isin] = {}
+                # Récupérer les résultats au fur et à mesure
+                for future in concurrent.futures.as_completed(futures):
+                    self._store_batch_result(results, futures[future], future.result)
 
         self._log("Batch fetch completed", {
             "total_isins": len(isins),
-            "successful": sum(1 for p in results.values() if p)
+            "successful": sum(1 for series in results.values() if len(series))
         })
 
         return results
 
-    def _fetch_all_prices_for_isin(self, isin: str) -> Dict[date, float]:
+    def _store_batch_result(self, results: Dict[str, Any], isin: str, fetch, *args):
+        """Exécute un fetch batch et range la série dans les résultats et le cache."""
+        try:
+            series = CachedSeries(*fetch(*args))
+            results[isin] = series
+
+            # Mettre à jour le cache (borné : on évince les ISINs les plus anciens)
+            with self._cache_lock:
+                self._batch_cache[isin] = series
+                self._batch_cache.move_to_end(isin)
+                while len(self._batch_cache) > self.BATCH_CACHE_MAX_ISINS:
+                    self._batch_cache.popitem(last=False)
+
+            self._log("Batch fetch completed for ISIN", {
+                "isin": isin,
+                "days_fetched": len(series)
+            })
+        except Exception as e:
+            self._log("Batch fetch failed for ISIN", {"isin": isin, "error": str(e)})
+            results[isin] = CachedSeries(*self._empty_series())
+
+    @staticmethod
+    def _empty_series() -> Tuple[np.ndarray, np.ndarray]:
+        """Série vide (dates, prix) pour un ISIN sans historique."""
+        return np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=np.float64)
+
+    def _fetch_all_prices_for_isin(self, isin: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fetch TOUS les prix historiques pour un ISIN, convertis en EUR.
+
+        Les cotations dans une autre devise sont converties au taux de change
+        du jour de chaque cotation (un seul historique FX par devise).
+        """
+        dates, prices, currency = self._load_full_history(isin, isin)
+        if not dates.size or not currency or currency == "EUR":
+            return dates, prices
+        return self._series_to_eur(isin, dates, prices, currency)
+
+    def _load_full_history(
+        self,
+        symbol: str,
+        cache_namespace: str
+    ) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
+        """
+        Historique complet (dates, prix, devise de cotation), via le cache disque si frais.
+
+        La dernière barre peut encore bouger : l'historique complet expire après
+        RECENT_CACHE_TTL_SECONDS. Un historique expiré mais de moins de
+        HISTORY_CACHE_TTL_SECONDS est complété en ne téléchargeant que la fin
+        (les cotations passées ne changent plus).
+        """
+        cached = self._file_cache.get_with_age(
+            cache_namespace, "history", "max", self.HISTORY_CACHE_TTL_SECONDS
+        )
+        history = self._history_from_cache(cached[0]) if cached is not None else None
+
+        if history is not None:
+            if cached[1] <= self.RECENT_CACHE_TTL_SECONDS:
+                return history
+            refreshed = self._refresh_history_tail(symbol, *history)
+            if refreshed is not None:
+                self._store_full_history(cache_namespace, *refreshed)
+                return refreshed
+
+        dates, prices, currency = self._download_all_prices_for_isin(symbol)
+        if dates.size:
+            self._store_full_history(cache_namespace, dates, prices, currency)
+        return dates, prices, currency
+
+    @staticmethod
+    def _history_from_cache(data: Any) -> Optional[Tuple[np.ndarray, np.ndarray, Optional[str]]]:
+        """Tableaux (dates, prix, devise) d'une entrée du cache disque, None si illisible."""
+        try:
+            dates = np.array(data["dates"], dtype=np.int64).astype('datetime64[D]')
+            prices = np.array(data["prices"], dtype=np.float64)
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not dates.size or dates.size != prices.size:
+            return None
+        return dates, prices, data.get("currency")
+
+    def _store_full_history(
+        self,
+        cache_namespace: str,
+        dates: np.ndarray,
+        prices: np.ndarray,
+        currency: Optional[str]
+    ):
+        """Écrit l'historique complet dans le cache disque."""
+        self._file_cache.set(cache_namespace, "history", "max", {
+            "dates": dates.astype(np.int64).tolist(),
+            "prices": prices.tolist(),
+            "currency": currency
+        })
+
+    def _refresh_history_tail(
+        self,
+        symbol: str,
+        dates: np.ndarray,
+        prices: np.ndarray,
+        currency: Optional[str]
+    ) -> Optional[Tuple[np.ndarray, np.ndarray, Optional[str]]]:
+        """
+        Complète un historique en cache avec les dernières séances seulement.
+
+        Les RECENT_DAYS derniers jours en cache sont re-téléchargés (la dernière
+        barre a pu bouger). None si la fin ne peut pas être récupérée ou si la
+        devise a changé : l'appelant retélécharge alors tout l'historique.
+        """
+        yahoo_symbol = self._resolve_yahoo_symbol(symbol)
+        if not yahoo_symbol:
+            return None
+
+        tail_start = dates[-1] - np.timedelta64(self.RECENT_DAYS, 'D')
+        try:
+            tail_dates, tail_prices, tail_currency = self._yahoo_chart_raw(
+                yahoo_symbol, period_start=int(tail_start.astype(np.int64)) * 86400
+            )
+        except _YAHOO_ERRORS as e:
+            self._log("Yahoo chart tail refresh error", {"symbol": symbol, "error": str(e)})
+            return None
+
+        if tail_currency and currency and tail_currency != currency:
+            return None
+        if not tail_dates.size:
+            # Pas de nouvelle séance : l'historique en cache est à jour
+            return dates, prices, currency
+
+        keep = dates < tail_dates[0]
+        return (
+            np.concatenate((dates[keep], tail_dates)),
+            np.concatenate((prices[keep], tail_prices)),
+            currency or tail_currency
+        )
+
+    def _download_all_prices_for_isin(self, isin: str) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
+        """
+        Télécharge TOUS les prix historiques pour un ISIN.
+
+        Interroge directement l'API chart de Yahoo (pas de DataFrame) et se
+        rabat sur yfinance si le symbole ou la réponse est inexploitable.
+        """
+        symbol = self._resolve_yahoo_symbol(isin)
+        if symbol:
+            try:
+                dates, prices, currency = self._yahoo_chart_raw(symbol)
+                if dates.size:
+                    return dates, prices, currency
+            except _YAHOO_ERRORS as e:
+                self._log("Yahoo chart API error", {"isin": isin, "symbol": symbol, "error": str(e)})
+
+        return self._download_all_prices_yfinance(isin)
+
+    def _resolve_yahoo_symbol(self, identifier: str) -> Optional[str]:
+        """Symbole Yahoo d'un ISIN (recherche mémorisée) ; les tickers sont gardés tels quels."""
+        if not self.is_valid_isin(identifier):
+            return identifier
+
+        with self._cache_lock:
+            if identifier in self._yahoo_symbols:
+                return self._yahoo_symbols[identifier]
+
+        symbol = None
+        try:
+            response = self._yahoo_session.get(
+                self.YAHOO_SEARCH_URL,
+                params={"q": identifier, "quotesCount": 1, "newsCount": 0},
+                timeout=8
+            )
+            response.raise_for_status()
+            quotes = _json_loads(response.content).get("quotes") or []
+            if quotes:
+                symbol = quotes[0].get("symbol")
+        except (*_YAHOO_ERRORS, AttributeError) as e:
+            self._log("Yahoo symbol search error", {"isin": identifier, "error": str(e)})
+            # Échec réseau : pas de mémorisation, on réessaiera
+            return None
+
+        with self._cache_lock:
+            self._yahoo_symbols[identifier] = symbol
+        return symbol
+
+    def _yahoo_chart_raw(
+        self,
+        symbol: str,
+        period_start: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
         """
-        Fetch TOUS les prix historiques pour un ISIN en une seule requête.
+        Historique quotidien (dates locales, clôtures, devise) via l'API chart.
 
-        Utilise yfinance.history(period='max') pour récupérer tout l'historique.
+        Tout l'historique par défaut, ou depuis period_start (epoch en secondes).
+        """
+        response = self._yahoo_session.get(
+            self.YAHOO_CHART_URL.format(symbol=symbol),
+            params={
+                "period1": self.YAHOO_MAX_PERIOD_START if period_start is None else period_start,
+                "period2": int(time.time()),
+                "interval": "1d",
+                "includePrePost": "false",
+            },
+            timeout=10
+        )
+        response.raise_for_status()
+        result = _json_loads(response.content)["chart"]["result"][0]
+
+        meta = result.get("meta") or {}
+        timestamps = result.get("timestamp") or []
+        closes = result["indicators"]["quote"][0].get("close") or []
+        if not timestamps or len(closes) != len(timestamps):
+            return (*self._empty_series(), meta.get("currency"))
+
+        # Horodatages UTC décalés à l'heure de la place avant de tronquer au jour
+        seconds = np.array(timestamps, dtype=np.int64) + int(meta.get("gmtoffset") or 0)
+        dates = (seconds // 86400).astype('datetime64[D]')
+        prices = np.array(closes, dtype=np.float64)  # None -> NaN
+
+        valid = np.isfinite(prices)
+        dates, prices = dates[valid], prices[valid]
+        if dates.size > 1 and (dates[1:] < dates[:-1]).any():
+            order = np.argsort(dates, kind='stable')
+            dates, prices = dates[order], prices[order]
+
+        return dates, prices, meta.get("currency")
+
+    def _download_all_prices_yfinance(self, isin: str) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
+        """
+        Télécharge TOUS les prix historiques pour un ISIN en une seule requête.
+
+        Utilise yfinance.history(period='max') pour récupérer tout l'historique
+        et le range en deux tableaux alignés (dates, prix) triés par date,
+        accompagnés de la devise de cotation.
         """
         try:
-            yf_ticker = yf.Ticker(isin)
-            hist = yf_ticker.history(period='max', interval='1d')
+            yf_ticker, yf_lock = self._get_yf_ticker(isin)
+            # Seule la clôture brute est utilisée, comme pour l'API chart :
+            # pas de colonnes dividendes/splits ni d'ajustement.
+            # history_metadata est relu sous le même verrou : il reflète le
+            # dernier appel à history() sur cette instance partagée
+            with yf_lock:
+                hist = yf_ticker.history(
+                    period='max', interval='1d', actions=False, auto_adjust=False
+                )
+                try:
+                    currency = (yf_ticker.history_metadata or {}).get("currency")
+                except Exception:
+                    currency = None
 
             if hist.empty:
                 self._log("No historical data", {"isin": isin})
-                return {}
+                return (*self._empty_series(), None)
+            closes = hist['Close']
+
+            # Index en heure locale de la place de cotation : on retire le fuseau
+            # avant de tronquer au jour, sinon la date peut reculer d'un jour
+            index = closes.index
+            if getattr(index, "tz", None) is not None:
+                index = index.tz_localize(None)
 
-            # Créer un dictionnaire date -> prix
-            prices = {}
-            for idx, row in hist.iterrows():
-                prices[idx.date()] = float(row['Close'])
+            dates = index.values.astype('datetime64[D]')
+            prices = closes.to_numpy(dtype=np.float64)
 
-            return prices
+            valid = np.isfinite(prices)
+            dates, prices = dates[valid], prices[valid]
+
+            # searchsorted exige des dates croissantes
+            if dates.size > 1 and (dates[1:] < dates[:-1]).any():
+                order = np.argsort(dates, kind='stable')
+                dates, prices = dates[order], prices[order]
+
+            return dates, prices, currency
 
         except Exception as e:
             self._log("Failed to fetch all prices", {"isin": isin, "error": str(e)})
-            return {}
+            return (*self._empty_series(), None)
+
+    def _series_to_eur(
+        self,
+        isin: str,
+        dates: np.ndarray,
+        prices: np.ndarray,
+        currency: str
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Convertit une série de cotations en EUR avec le taux FX de chaque date."""
+        code, factor = _MINOR_CURRENCY_UNITS.get(currency, (currency.upper(), 1.0))
+        if code == "EUR":
+            return dates, prices * factor
+
+        fx_history = self._get_fx_history(code)
+        if fx_history is None:
+            # Sans taux, une série en devise étrangère fausserait les valorisations
+            self._log("No FX history for batch series", {"isin": isin, "currency": code})
+            return self._empty_series()
+
+        fx_dates, fx_rates = fx_history
+        # Taux du jour ou, à défaut, le plus récent avant (le premier connu au-delà)
+        idx = np.searchsorted(fx_dates, dates, side='right') - 1
+        np.maximum(idx, 0, out=idx)
+        return dates, prices * factor * fx_rates[idx]
+
+    def _get_fx_history(self, currency: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Historique quotidien du taux currency -> EUR, récupéré une seule fois par
+        devise et par FX_HISTORY_TTL_SECONDS pour tous les ISINs du batch.
+        """
+        with self._cache_lock:
+            cached = self._fx_history_cache.get(currency)
+        if cached and time.time() - cached[1] < self.FX_HISTORY_TTL_SECONDS:
+            return cached[0]
+
+        # Un seul thread télécharge une devise donnée, les autres réutilisent le
+        # résultat ; des devises différentes se téléchargent en parallèle
+        with self._cache_lock:
+            fetch_lock = self._fx_fetch_locks.setdefault(currency, threading.Lock())
+        with fetch_lock:
+            with self._cache_lock:
+                cached = self._fx_history_cache.get(currency)
+            if cached and time.time() - cached[1] < self.FX_HISTORY_TTL_SECONDS:
+                return cached[0]
+
+            fx_dates, fx_rates, _ = self._load_full_history(f"{currency}EUR=X", f"{currency}EUR")
+            if not fx_dates.size:
+                return None
+
+            now = time.time()
+            with self._cache_lock:
+                self._fx_history_cache[currency] = ((fx_dates, fx_rates), now)
+                # Le dernier taux sert aussi aux conversions au comptant
+                self._fx_cache[currency] = (float(fx_rates[-1]), now)
+            return fx_dates, fx_rates
+
+    def _get_batch_series(self, isin: str) -> Optional[CachedSeries]:
+        """Série batch en cache pour l'ISIN (marquée comme récemment utilisée), ou None."""
+        with self._cache_lock:
+            series = self._batch_cache.get(isin)
+            if series is not None:
+                self._batch_cache.move_to_end(isin)
+        return series
 
     def get_historical_price_from_batch(self, isin: str, target_date: date) -> Optional[float]:
         """
         Récupère un prix historique depuis le cache batch.
 
         Si le cache n'existe pas pour cet ISIN, retourne None.
-        Cherche le prix à la date exacte ou la date la plus proche avant target_date.
+        Cherche le prix à la date exacte ou la date la plus proche avant target_date
+        (recherche dichotomique sur les dates triées).
         """
-        if isin not in self._batch_cache:
+        series = self._get_batch_series(isin)
+        if series is None:
             return None
 
-        price_cache = self._batch_cache[isin]
+        idx = int(np.searchsorted(series.dates, np.datetime64(target_date, 'D'), side='right')) - 1
 
-        if not price_cache:
-            return None
+        if idx >= 0:
+            return float(series.prices[idx])
 
-        # Chercher la date exacte ou la plus proche avant
-        available_dates = sorted([d for d in price_cache.keys() if d <= target_date], reverse=True)
+        return None
 
-        if available_dates:
-            best_date = available_dates[0]
-            return price_cache[best_date]
+    def get_price_matrix_from_batch(self, isins: List[str], target_dates: List[date]) -> np.ndarray:
+        """
+        Récupère d'un coup les prix batch de plusieurs ISINs à plusieurs dates.
 
-        return None
+        Retourne une matrice (len(isins), len(target_dates)) ; NaN quand l'ISIN
+        n'est pas en cache ou n'a pas de cotation à cette date ou avant.
+        Une seule recherche dichotomique vectorisée par ISIN.
+        """
+        targets = np.array(target_dates, dtype='datetime64[D]')
+        matrix = np.full((len(isins), targets.size), np.nan)
+
+        for row, isin in enumerate(isins):
+            series = self._get_batch_series(isin)
+            if series is None:
+                continue
+
+            idx = np.searchsorted(series.dates, targets, side='right') - 1
+            found = idx >= 0
+            matrix[row, found] = series.prices[idx[found]]
+
+        return matrix
 
     def clear_batch_cache(self):
         """Vide le cache batch (utile pour libérer de la mémoire)."""
-        self._batch_cache = {}
+        with self._cache_lock:
+            self._batch_cache.clear()
         self._log("Batch cache cleared")
\ No newline at end of file